@@ -0,0 +1,4 @@
+from swify.asgi import create_asgi_app
+
+# ASGI entry point: uvicorn asgi:app (see requirements-asgi.txt)
+app = create_asgi_app()
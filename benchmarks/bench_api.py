@@ -0,0 +1,325 @@
+"""Benchmark every API route through the Flask test client and a real WSGI server.
+
+Generates a dataset with benchmarks/dataset.py once, then for each target
+(the in-process test client, and a threaded werkzeug server on localhost
+spoken to over HTTP) runs every scenario --requests times against a fresh
+copy of it and reports throughput and p50/p95/p99 latency. Routes that no
+scenario reached are listed, so new endpoints do not go unmeasured.
+
+--save writes the results as a JSON baseline; --baseline compares against
+one and exits non-zero when a scenario's --metric latency grew by more than
+--threshold, or when any request failed.
+
+    python benchmarks/bench_api.py --users 5 --tasks 500 --requests 100 --save baseline.json
+    python benchmarks/bench_api.py --users 5 --tasks 500 --requests 100 --baseline baseline.json --threshold 0.25
+"""
+import argparse
+import http.client
+import io
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from flask import request
+from werkzeug.datastructures import FileStorage
+from werkzeug.serving import make_server
+from werkzeug.test import encode_multipart
+
+import dataset
+
+USER = 'user0'
+HEADERS = {'X-User-ID': USER}
+
+
+class ClientTarget:
+    name = 'client'
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, data=body, headers={**HEADERS, **(headers or {})})
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+class ServerTarget:
+    name = 'server'
+
+    def __init__(self, app):
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def request(self, method, path, body=None, headers=None):
+        # A connection per request, as the development server closes them anyway
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+        try:
+            conn.request(method, path, body=body, headers={**HEADERS, **(headers or {})})
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def as_json(value):
+    return json.dumps(value).encode(), {'Content-Type': 'application/json'}
+
+
+def as_form(values):
+    boundary, body = encode_multipart(values)
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+# Scenario functions make one logical operation through target.request and return the statuses they saw.
+# state holds ids picked from the dataset at start and ids created along the way.
+def list_board(target, state, rng):
+    return [target.request('GET', '/api/tasks')[0]]
+
+def list_page(target, state, rng):
+    status, body = target.request('GET', '/api/tasks?limit=50')
+    cursor = json.loads(body).get('next_cursor')
+    return [status] + ([target.request('GET', f'/api/tasks?limit=50&cursor={cursor}')[0]] if cursor else [])
+
+def list_sparse(target, state, rng):
+    return [target.request('GET', '/api/tasks?fields=title,color,is_pinned&include=')[0]]
+
+def list_stream(target, state, rng):
+    return [target.request('GET', '/api/tasks?stream=ndjson')[0]]
+
+def search(target, state, rng):
+    return [target.request('GET', f"/api/tasks?q={rng.choice(state['words'])}")[0]]
+
+def tag_facets(target, state, rng):
+    return [target.request('GET', '/api/tags')[0]]
+
+def changes(target, state, rng):
+    return [target.request('GET', f"/api/changes?since={max(0, state['seq'] - 50)}")[0]]
+
+def cache_stats(target, state, rng):
+    return [target.request('GET', '/api/cache/stats')[0]]
+
+def storage_usage(target, state, rng):
+    return [target.request('GET', '/api/storage/usage')[0]]
+
+def serve_upload(target, state, rng):
+    if not state['files']: return []
+    return [target.request('GET', '/static/' + rng.choice(state['files']), headers={'Range': 'bytes=0-1023'})[0]]
+
+def thumbnail(target, state, rng):
+    if not state['images']: return []
+    return [target.request('GET', f"/api/thumbnails/{rng.choice(state['images'])}/160")[0]]
+
+def create_task(target, state, rng):
+    body, headers = as_form({'title': f'bench {rng.random()}', 'category': 'Work', 'priority': 'High', 'tags': 'bench',
+                             'attachment': FileStorage(io.BytesIO(rng.randbytes(4096)), 'bench.bin')})
+    status, data = target.request('POST', '/api/tasks', body, headers)
+    if status < 400: state['created'].append(json.loads(data)['id'])
+    return [status]
+
+def update_task(target, state, rng):
+    task_id = rng.choice(state['tasks'])
+    body, headers = as_form({'title': f'edited {rng.random()}', 'description': 'edited', 'priority': rng.choice(['High', 'Low'])})
+    return [target.request('PUT', f'/api/tasks/{task_id}', body, headers)[0]]
+
+def batch(target, state, rng):
+    ops = [{'op': 'update', 'id': task_id, 'task': {'color': rng.choice(['red', 'blue'])}} for task_id in rng.sample(state['tasks'], 20)]
+    body, headers = as_json({'ops': ops})
+    return [target.request('POST', '/api/tasks/batch', body, headers)[0]]
+
+def complete(target, state, rng):
+    return [target.request('POST', f"/api/tasks/{rng.choice(state['tasks'])}/complete")[0]]
+
+def toggle_pin(target, state, rng):
+    return [target.request('POST', f"/api/tasks/{rng.choice(state['tasks'])}/toggle-pin")[0]]
+
+def task_flag(target, state, rng):
+    task_id = rng.choice(state['tasks'])
+    if rng.random() < 0.5:
+        return [target.request('POST', f'/api/tasks/{task_id}/is_pinned/toggle')[0]]
+    return [target.request('PUT', f'/api/tasks/{task_id}/completed', *as_json({'value': rng.random() < 0.5}))[0]]
+
+def subtask_add(target, state, rng):
+    status, data = target.request('POST', f"/api/tasks/{rng.choice(state['tasks'])}/subtasks", *as_json({'text': 'bench step'}))
+    if status < 400: state['subtasks_created'].append(json.loads(data)['id'])
+    return [status]
+
+def subtask_toggle(target, state, rng):
+    return [target.request('POST', f"/api/subtasks/{rng.choice(state['subtasks'])}/toggle")[0]]
+
+def subtask_flag(target, state, rng):
+    subtask_id = rng.choice(state['subtasks'])
+    if rng.random() < 0.5:
+        return [target.request('POST', f'/api/subtasks/{subtask_id}/completed/toggle')[0]]
+    return [target.request('PUT', f'/api/subtasks/{subtask_id}/completed', *as_json({'value': rng.random() < 0.5}))[0]]
+
+def subtasks_patch(target, state, rng):
+    task_id, subtask_ids = rng.choice(state['checklists'])
+    patch = {'update': [{'id': i, 'text': f'step {rng.randint(0, 99)}'} for i in subtask_ids[:3]], 'toggle': subtask_ids[3:5], 'order': list(reversed(subtask_ids))}
+    return [target.request('PATCH', f'/api/tasks/{task_id}/subtasks', *as_json(patch))[0]]
+
+def subtask_delete(target, state, rng):
+    if not state['subtasks_created']: return []
+    return [target.request('DELETE', f"/api/subtasks/{state['subtasks_created'].pop()}")[0]]
+
+def resumable_upload(target, state, rng):
+    data = rng.randbytes(256 * 1024)
+    status, body = target.request('POST', '/api/uploads', *as_json({'filename': 'bench.bin', 'size': len(data)}))
+    if status >= 400: return [status]
+    upload_id = json.loads(body)['upload_id']
+    statuses = [status]
+    half = len(data) // 2
+    statuses.append(target.request('PATCH', f'/api/uploads/{upload_id}', data[:half], {'Upload-Offset': '0'})[0])
+    statuses.append(target.request('GET', f'/api/uploads/{upload_id}')[0])
+    statuses.append(target.request('PATCH', f'/api/uploads/{upload_id}', data[half:], {'Upload-Offset': str(half)})[0])
+    statuses.append(target.request('POST', f'/api/uploads/{upload_id}/complete', *as_json({'task_id': rng.choice(state['tasks'])}))[0])
+    return statuses
+
+def delete_task(target, state, rng):
+    if not state['created']: return []
+    return [target.request('DELETE', f"/api/tasks/{state['created'].pop()}")[0]]
+
+# Reads first, then writes; the deletes consume what the creates made
+SCENARIOS = [list_board, list_page, list_sparse, list_stream, search, tag_facets, changes, cache_stats, storage_usage, serve_upload, thumbnail,
+             create_task, update_task, batch, complete, toggle_pin, task_flag, subtask_add, subtask_toggle, subtask_flag, subtasks_patch,
+             subtask_delete, resumable_upload, delete_task]
+
+
+def initial_state(app):
+    from swify.models import db, Task, Subtask, Attachment, UserSequence
+    with app.app_context():
+        tasks = db.session.execute(db.select(Task.id).where(Task.user_id == USER).order_by(Task.id)).scalars().all()
+        rows = db.session.execute(db.select(Subtask.task_id, Subtask.id).join(Task).where(Task.user_id == USER).order_by(Subtask.task_id, Subtask.position)).all()
+        attachments = db.session.execute(db.select(Attachment.file_path, Attachment.file_type, Attachment.blob_sha256).join(Task).where(Task.user_id == USER)).all()
+        titles = db.session.execute(db.select(Task.title).where(Task.user_id == USER).limit(200)).scalars().all()
+        seq = db.session.execute(db.select(UserSequence.seq).where(UserSequence.user_id == USER)).scalar() or 0
+    checklists = {}
+    for task_id, subtask_id in rows:
+        checklists.setdefault(task_id, []).append(subtask_id)
+    return {
+        'tasks': tasks, 'subtasks': [subtask_id for _, subtask_id in rows], 'seq': seq,
+        'checklists': [(task_id, ids) for task_id, ids in checklists.items() if len(ids) >= 2],
+        'files': sorted({path for path, _, _ in attachments}), 'images': sorted({sha for _, kind, sha in attachments if kind == 'image' and sha}),
+        'words': sorted({word for title in titles for word in title.split()})[:50] or ['task'],
+        'created': [], 'subtasks_created': [],
+    }
+
+
+def percentile(samples, q):
+    return statistics.quantiles(samples, n=100, method='inclusive')[q - 1] if len(samples) > 1 else samples[0]
+
+
+def run_target(kind, template, uploads, tmp, requests, warmup, cache, seed):
+    db_path = os.path.join(tmp, f'{kind}.db')
+    # The backup API includes anything still in the template's WAL, which a file copy would miss
+    with sqlite3.connect(template) as src, sqlite3.connect(db_path) as dst:
+        src.backup(dst)
+    app = dataset.make_app(db_path, uploads, RESPONSE_CACHE_BYTES=32 * 1024 * 1024 if cache else 0)
+    hit = set()
+    app.before_request(lambda: hit.add(request.endpoint))
+    target = ClientTarget(app) if kind == 'client' else ServerTarget(app)
+    state = initial_state(app)
+    results = {}
+    try:
+        for scenario in SCENARIOS:
+            rng = random.Random(f'{seed}-{scenario.__name__}')
+            samples, errors = [], 0
+            for i in range(warmup + requests):
+                start = time.perf_counter()
+                statuses = scenario(target, state, rng)
+                elapsed = time.perf_counter() - start
+                if not statuses: continue
+                errors += sum(status >= 400 for status in statuses)
+                if i >= warmup: samples.append(elapsed)
+            if not samples: continue
+            results[f'{kind}/{scenario.__name__}'] = {
+                'count': len(samples), 'errors': errors, 'rps': len(samples) / sum(samples),
+                'p50': percentile(samples, 50), 'p95': percentile(samples, 95), 'p99': percentile(samples, 99),
+            }
+    finally:
+        target.close()
+    routes = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint != 'static'}
+    return results, sorted(routes - hit)
+
+
+def compare(results, baseline, metric, threshold):
+    failures = []
+    for key, current in results.items():
+        if current['errors']:
+            failures.append(f"{key}: {current['errors']} failed requests")
+        before = baseline['results'].get(key)
+        if before and current[metric] > before[metric] * (1 + threshold):
+            failures.append(f"{key}: {metric} {before[metric] * 1000:.2f}ms -> {current[metric] * 1000:.2f}ms (+{current[metric] / before[metric] - 1:.0%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--tasks', type=int, default=500, help='per user')
+    parser.add_argument('--subtasks', type=int, default=5, help='per task')
+    parser.add_argument('--attachments', type=int, default=1, help='per task')
+    parser.add_argument('--description-size', type=int, default=200, help='characters')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=50, help='measured operations per scenario and target')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--targets', nargs='+', choices=['client', 'server'], default=['client', 'server'])
+    parser.add_argument('--cache', action='store_true', help='leave the response cache on (off by default, so reads hit the database)')
+    parser.add_argument('--save', help='write results to this JSON baseline')
+    parser.add_argument('--baseline', help='compare with this JSON baseline')
+    parser.add_argument('--metric', choices=['p50', 'p95', 'p99'], default='p95')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative latency growth before failing')
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    params = {key: getattr(args, key) for key in ('users', 'tasks', 'subtasks', 'attachments', 'description_size', 'seed', 'requests', 'cache')}
+    results, uncovered = {}, None
+    with tempfile.TemporaryDirectory() as tmp:
+        template, uploads = os.path.join(tmp, 'template.db'), os.path.join(tmp, 'uploads')
+        start = time.perf_counter()
+        dataset.build(dataset.make_app(template, uploads), args.users, args.tasks, args.subtasks, args.attachments, args.description_size, args.seed)
+        print(f'dataset: {args.users} users x {args.tasks} tasks in {time.perf_counter() - start:.1f}s')
+        for kind in args.targets:
+            target_results, missed = run_target(kind, template, uploads, tmp, args.requests, args.warmup, args.cache, args.seed)
+            results.update(target_results)
+            uncovered = set(missed) if uncovered is None else uncovered & set(missed)
+
+    print(f"{'scenario':<32}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for key, r in results.items():
+        print(f"{key:<32}{r['rps']:>10.1f}{r['p50'] * 1000:>10.2f}{r['p95'] * 1000:>10.2f}{r['p99'] * 1000:>10.2f}{r['errors']:>8}")
+    if uncovered:
+        print('routes no scenario reached: ' + ', '.join(sorted(uncovered)))
+
+    report = {'params': params, 'python': platform.python_version(), 'platform': platform.platform(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['params'] != params:
+            print(f"warning: baseline was recorded with different parameters: {baseline['params']}")
+        failures = compare(results, baseline, args.metric, args.threshold)
+        if failures:
+            print('FAIL:\n  ' + '\n  '.join(failures))
+            sys.exit(1)
+        print(f'no {args.metric} regression beyond {args.threshold:.0%}')
+    elif any(r['errors'] for r in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Compare WSGI and ASGI serving under slow uploads mixed with fast reads.
+
+Builds a dataset with benchmarks/dataset.py, then serves a copy of it from a
+separate process in each mode with the same number of worker threads: WSGI
+(a werkzeug server handing each connection to a fixed pool, like gunicorn's
+gthread workers) and ASGI (uvicorn running swify.asgi). While --uploaders
+clients trickle --upload-mb attachments to POST /api/tasks at
+--upload-kbps, --readers clients fetch GET /api/tasks back to back for
+--duration seconds. Reports read latency and throughput, and how many
+uploads finished, for each mode.
+
+    python benchmarks/bench_concurrency.py --workers 4 --uploaders 8 --readers 4 --duration 10
+"""
+import argparse
+import http.client
+import os
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dataset
+
+READER = 'user0'
+UPLOADER = 'uploader'
+MODES = ('wsgi', 'asgi')
+BOUNDARY = 'swify-bench-boundary'
+
+
+def serve(mode, db_path, uploads, port, workers):
+    # Runs in the server subprocess
+    if mode == 'asgi':
+        import uvicorn
+        sys.path.insert(0, dataset.ROOT)
+        from swify.asgi import create_asgi_app
+        app = create_asgi_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'UPLOAD_FOLDER': uploads, 'ASGI_WORKERS': workers})
+        uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning')
+        return
+    import logging
+    from werkzeug.serving import BaseWSGIServer
+    # Uploads cut off when the run ends would otherwise be logged one by one
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    class PooledWSGIServer(BaseWSGIServer):
+        # Each connection is handled on one of a fixed number of threads, as in a threaded WSGI worker
+        pool = ThreadPoolExecutor(workers)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.handle, request, client_address)
+
+        def handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer('127.0.0.1', port, dataset.make_app(db_path, uploads)).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    sys.exit(f'server on port {port} did not start')
+
+
+def upload(port, size, kbps, stop):
+    # One slow multipart POST /api/tasks; returns its duration in seconds, or None when it failed
+    head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="title"\r\n\r\nslow upload\r\n'
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="attachment"; filename="upload.bin"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n').encode()
+    tail = f'\r\n--{BOUNDARY}--\r\n'.encode()
+    step = max(1, kbps * 1024 // 10)
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        conn.putrequest('POST', '/api/tasks')
+        conn.putheader('X-User-ID', UPLOADER)
+        conn.putheader('Content-Type', f'multipart/form-data; boundary={BOUNDARY}')
+        conn.putheader('Content-Length', str(len(head) + size + len(tail)))
+        conn.endheaders()
+        conn.send(head)
+        chunk = os.urandom(step)
+        for sent in range(0, size, step):
+            if stop.is_set():
+                return None
+            conn.send(chunk[:min(step, size - sent)])
+            time.sleep(0.1)
+        conn.send(tail)
+        response = conn.getresponse()
+        response.read()
+        return time.perf_counter() - start if response.status == 201 else None
+    except OSError:
+        return None
+    finally:
+        conn.close()
+
+
+def read(port):
+    # One GET /api/tasks on a fresh connection; returns its latency, or None when it failed
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.request('GET', '/api/tasks', headers={'X-User-ID': READER, 'Connection': 'close'})
+        response = conn.getresponse()
+        response.read()
+        return time.perf_counter() - start if response.status == 200 else None
+    except OSError:
+        return None
+    finally:
+        conn.close()
+
+
+def run_mode(mode, template, tmp, args):
+    db_path = os.path.join(tmp, f'{mode}.db')
+    # The backup API includes anything still in the template's WAL, which a file copy would miss
+    with sqlite3.connect(template) as src, sqlite3.connect(db_path) as dst:
+        src.backup(dst)
+    port = free_port()
+    server = subprocess.Popen([sys.executable, __file__, '--serve', mode, '--db', db_path, '--uploads', os.path.join(tmp, f'{mode}-uploads'),
+                               '--port', str(port), '--workers', str(args.workers)])
+    try:
+        wait_for(port)
+        stop = threading.Event()
+        reads, uploads, errors = [], [], 0
+        lock = threading.Lock()
+
+        def uploader():
+            nonlocal errors
+            while not stop.is_set():
+                seconds = upload(port, args.upload_mb * 1024 * 1024, args.upload_kbps, stop)
+                with lock:
+                    if seconds is not None: uploads.append(seconds)
+                    elif not stop.is_set(): errors += 1
+
+        def reader():
+            nonlocal errors
+            while not stop.is_set():
+                seconds = read(port)
+                with lock:
+                    if seconds is not None: reads.append(seconds)
+                    else: errors += 1
+
+        threads = [threading.Thread(target=uploader, daemon=True) for _ in range(args.uploaders)]
+        for thread in threads:
+            thread.start()
+        # Let the uploads take hold of the server before reads are measured
+        time.sleep(1)
+        readers = [threading.Thread(target=reader, daemon=True) for _ in range(args.readers)]
+        start = time.perf_counter()
+        for thread in readers:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in readers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+    return reads, uploads, errors, elapsed
+
+
+def percentile(samples, q):
+    return statistics.quantiles(samples, n=100, method='inclusive')[q - 1] if len(samples) > 1 else samples[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=200, help='on the board being read')
+    parser.add_argument('--workers', type=int, default=4, help='worker threads in either mode')
+    parser.add_argument('--uploaders', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--upload-mb', type=int, default=4)
+    parser.add_argument('--upload-kbps', type=int, default=512, help='per uploader')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of reads')
+    parser.add_argument('--modes', default=','.join(MODES))
+    # Internal: how the server subprocess is started
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--uploads', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.serve, args.db, args.uploads, args.port, args.workers)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, 'template.db')
+        app = dataset.make_app(template, os.path.join(tmp, 'uploads'))
+        dataset.build(app, 1, args.tasks, 3, 0, 200)
+        results = [(mode, *run_mode(mode, template, tmp, args)) for mode in args.modes.split(',')]
+
+    print(f'{args.workers} workers; {args.uploaders} uploaders sending {args.upload_mb} MB at {args.upload_kbps} KB/s; '
+          f'{args.readers} readers of a {args.tasks}-task board for {args.duration:g}s')
+    print(f"{'mode':<6}{'reads':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'uploads':>9}{'upload s':>10}{'errors':>8}")
+    for mode, reads, uploads, errors, elapsed in results:
+        if reads:
+            latency = ''.join(f'{value * 1000:>9.1f}' for value in (percentile(reads, 50), percentile(reads, 95), percentile(reads, 99), max(reads)))
+        else:
+            latency = f"{'-':>9}" * 4
+        mean_upload = f'{statistics.mean(uploads):>10.1f}' if uploads else f"{'-':>10}"
+        print(f'{mode:<6}{len(reads):>8}{len(reads) / elapsed:>9.1f}{latency}{len(uploads):>9}{mean_upload}{errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
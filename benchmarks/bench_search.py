@@ -0,0 +1,102 @@
+"""Compare LIKE search with the FTS5 index used by GET /api/tasks?q=.
+
+Builds a throwaway SQLite database with the task/subtask columns and the
+FTS5 table definition from swify/schema.py, filled with Zipf-distributed
+synthetic text, then times both query shapes for common and rare terms.
+
+    python benchmarks/bench_search.py --tasks 100000
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+SYLLABLES = 'ba be bi bo bu ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no nu ra re ri ro ru sa se si so su ta te ti to tu'.split()
+# A few real words planted among the synthetic vocabulary at known ranks
+PLANTED = {5: 'groceries', 200: 'invoice', 5000: 'algebra'}
+
+
+def vocabulary(rng, size):
+    words = sorted({''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size * 2)})[:size]
+    rng.shuffle(words)
+    for rank, word in PLANTED.items():
+        words[rank] = word
+    # Zipf-like frequencies, as in natural text
+    return words, list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+
+
+# Mirrors the task/subtask columns and FTS_SCHEMA statements in swify/schema.py
+SCHEMA = [
+    "CREATE TABLE task (id INTEGER PRIMARY KEY, title VARCHAR(100), description TEXT, tags VARCHAR(200), user_id VARCHAR(50))",
+    "CREATE TABLE subtask (id INTEGER PRIMARY KEY, text VARCHAR(100), task_id INTEGER)",
+]
+FTS_SCHEMA = [
+    "CREATE INDEX ix_subtask_task_id ON subtask (task_id)",
+    "CREATE VIRTUAL TABLE task_fts USING fts5(title, description, tags, subtasks, tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO task_fts (rowid, title, description, tags, subtasks) SELECT id, title, description, tags, (SELECT group_concat(text, ' ') FROM subtask WHERE task_id = task.id) FROM task",
+]
+
+LIKE_QUERY = ("SELECT id FROM task WHERE user_id = ? AND "
+              "(title LIKE '%' || ? || '%' OR description LIKE '%' || ? || '%' OR tags LIKE '%' || ? || '%')")
+FTS_QUERY = ("SELECT task.id FROM task JOIN (SELECT rowid AS task_id, bm25(task_fts, 10.0, 1.0, 5.0, 2.0) AS rank "
+             "FROM task_fts WHERE task_fts MATCH ?) AS matches ON matches.task_id = task.id "
+             "WHERE task.user_id = ? ORDER BY matches.rank")
+
+
+def build(path, tasks, users, description_words, seed=7):
+    rng = random.Random(seed)
+    words, weights = vocabulary(rng, 20000)
+
+    def sentence(n):
+        return ' '.join(rng.choices(words, cum_weights=weights, k=n))
+
+    conn = sqlite3.connect(path)
+    for statement in SCHEMA:
+        conn.execute(statement)
+    task_rows = ((i, sentence(3), sentence(description_words), ','.join(sentence(2).split()), f'user{i % users}')
+                 for i in range(1, tasks + 1))
+    conn.executemany("INSERT INTO task (id, title, description, tags, user_id) VALUES (?, ?, ?, ?, ?)", task_rows)
+    subtask_rows = ((sentence(3), rng.randint(1, tasks)) for _ in range(tasks // 2))
+    conn.executemany("INSERT INTO subtask (text, task_id) VALUES (?, ?)", subtask_rows)
+    # Same backfill the app runs when the index is first created on an existing database
+    for statement in FTS_SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+    return conn
+
+
+def timed(conn, sql, params, repeat):
+    samples, rows = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = len(conn.execute(sql, params).fetchall())
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--description-words', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        conn = build(os.path.join(tmp, 'bench.db'), args.tasks, args.users, args.description_words)
+        print(f'built {args.tasks} tasks in {time.perf_counter() - start:.1f}s')
+        print(f"{'query':<14}{'LIKE ms':>10}{'FTS ms':>10}{'speedup':>10}{'rows':>8}")
+        for term in ('groceries', 'invoice', 'algebra', 'alg', 'zzz'):
+            like_ms, like_rows = timed(conn, LIKE_QUERY, ('user0', term, term, term), args.repeat)
+            fts_ms, fts_rows = timed(conn, FTS_QUERY, (f'"{term}"*', 'user0'), args.repeat)
+            print(f'{term:<14}{like_ms:>10.2f}{fts_ms:>10.2f}{like_ms / max(fts_ms, 1e-6):>9.1f}x{fts_rows:>8}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
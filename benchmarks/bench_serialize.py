@@ -0,0 +1,109 @@
+"""Compare the ORM to_dict() list serialization with the Core row serializer.
+
+Seeds a throwaway database with one user's board (subtasks and attachments
+included), then times building the GET /api/tasks body in-process:
+ORM instances + to_dict() + the stdlib encoder, as the list view used to;
+Core rows + serialize_tasks() with either encoder; and a sparse
+fields=id,title,color,is_pinned list without children.
+
+    python benchmarks/bench_serialize.py --tasks 2000 --runs 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy.orm import selectinload  # noqa: E402
+from swify import create_app  # noqa: E402
+from swify.models import db, Task, Subtask, Attachment  # noqa: E402
+from swify.serialize import LIST_FIELDS, LIST_INCLUDES, list_columns, serialize_tasks, orjson  # noqa: E402
+from swify.tasks import TASK_SORT  # noqa: E402
+
+SPARSE = ['id', 'title', 'color', 'is_pinned']
+
+
+def seed(tasks, subtasks, attachments):
+    db.session.execute(db.insert(Task), [
+        {'title': f'task {i}', 'description': 'lorem ipsum ' * 8, 'category': 'Work' if i % 3 else 'Personal', 'priority_rank': i % 4 + 1,
+         'completed': i % 5 == 0, 'is_pinned': i % 17 == 0, 'focus_duration': 25, 'color': 'default', 'tags': 'home,errand', 'user_id': 'user0'}
+        for i in range(tasks)])
+    ids = db.session.execute(db.select(Task.id)).scalars().all()
+    db.session.execute(db.insert(Subtask), [{'text': f'step {j}', 'task_id': task_id, 'position': j} for task_id in ids for j in range(subtasks)])
+    db.session.execute(db.insert(Attachment), [{'file_path': f'uploads/{task_id}-{j}.png', 'file_type': 'image', 'blob_sha256': f'{task_id:064x}', 'task_id': task_id}
+                                               for task_id in ids for j in range(attachments)])
+    db.session.commit()
+
+
+def board_query():
+    order = [col.desc() if desc else col for col, desc in TASK_SORT]
+    return Task.query.filter_by(user_id='user0').order_by(*order)
+
+
+def orm_to_dict(dumps):
+    tasks = board_query().options(selectinload(Task.subtasks), selectinload(Task.attachments)).all()
+    return dumps({'tasks': [task.to_dict() for task in tasks]})
+
+
+def core_rows(fields, include, dumps):
+    rows = board_query().with_entities(*list_columns(fields, False)).all()
+    return dumps({'tasks': serialize_tasks(rows, fields, include)})
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        body = fn()
+        samples.append(time.perf_counter() - start)
+        db.session.rollback()
+    return statistics.median(samples), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--subtasks', type=int, default=5, help='per task')
+    parser.add_argument('--attachments', type=int, default=1, help='per task')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    fields = list(LIST_FIELDS)
+    stdlib = json.dumps
+    fast = (lambda obj: orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)) if orjson else None
+    cases = [
+        ('orm to_dict + json', lambda: orm_to_dict(stdlib)),
+        ('core rows + json', lambda: core_rows(fields, LIST_INCLUDES, stdlib)),
+    ]
+    if fast:
+        cases += [
+            ('core rows + orjson', lambda: core_rows(fields, LIST_INCLUDES, fast)),
+            ('sparse fields + orjson', lambda: core_rows(SPARSE, [], fast)),
+        ]
+    else:
+        print('orjson is not installed; the stdlib encoder is all the app will use')
+        cases.append(('sparse fields + json', lambda: core_rows(SPARSE, [], stdlib)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp, 'bench.db'), 'UPLOAD_FOLDER': os.path.join(tmp, 'uploads')})
+        with app.app_context():
+            seed(args.tasks, args.subtasks, args.attachments)
+            results = [(name, *timed(fn, args.runs)) for name, fn in cases]
+            db.session.remove()
+            db.engine.dispose()
+
+    baseline = results[0][1]
+    print(f'{args.tasks} tasks, {args.subtasks} subtasks and {args.attachments} attachments each; median of {args.runs} runs')
+    print(f"{'path':<26}{'ms':>10}{'speedup':>10}{'bytes':>12}")
+    for name, seconds, size in results:
+        print(f'{name:<26}{seconds * 1000:>10.1f}{baseline / seconds:>9.1f}x{size:>12}')
+
+
+if __name__ == '__main__':
+    main()
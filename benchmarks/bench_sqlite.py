@@ -0,0 +1,105 @@
+"""Stress one SQLite database from several worker processes reading and writing at once.
+
+Each worker builds its own app, as a gunicorn worker would, against a shared
+database file and loops over a request mix for --seconds: board reads
+(GET /api/tasks, response cache disabled), task creates and completion
+toggles. It runs once per SQLITE_PROFILE on a fresh database and reports
+throughput, failed requests (5xx, e.g. "database is locked") and latency.
+
+    python benchmarks/bench_sqlite.py --workers 8 --seconds 10 --write-ratio 0.3
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEADERS = {'X-User-ID': 'bench'}
+
+
+def make_app(db_path, profile):
+    sys.path.insert(0, ROOT)
+    from swify import create_app
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'UPLOAD_FOLDER': os.path.join(os.path.dirname(db_path), 'uploads'),
+                      'SQLITE_PROFILE': profile, 'RESPONSE_CACHE_BYTES': 0})
+    # Failed requests are counted, not printed
+    logging.getLogger(app.name).setLevel(logging.CRITICAL)
+    return app
+
+
+def seed(db_path, profile, tasks):
+    app = make_app(db_path, profile)
+    client = app.test_client()
+    for start in range(0, tasks, 500):
+        ops = [{'op': 'create', 'task': {'title': f'task {i}', 'category': random.choice(['Personal', 'Work'])}} for i in range(start, min(tasks, start + 500))]
+        client.post('/api/tasks/batch', json={'ops': ops}, headers=HEADERS)
+
+
+def worker(db_path, profile, seconds, write_ratio, tasks, ready, results):
+    app = make_app(db_path, profile)
+    client = app.test_client()
+    rng = random.Random(os.getpid())
+    stats = {'read': [], 'write': [], 'errors': 0}
+    ready.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if rng.random() < write_ratio:
+            kind = 'write'
+            if rng.random() < 0.5:
+                response = client.post('/api/tasks', data={'title': 'stress', 'category': 'Work'}, headers=HEADERS)
+            else:
+                response = client.post(f'/api/tasks/{rng.randint(1, tasks)}/complete', headers=HEADERS)
+        else:
+            kind = 'read'
+            response = client.get('/api/tasks?limit=50', headers=HEADERS)
+        if response.status_code >= 500:
+            stats['errors'] += 1
+        else:
+            stats[kind].append(time.perf_counter() - start)
+    results.put(stats)
+
+
+def run(profile, workers, seconds, write_ratio, tasks):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'stress.db')
+        seed(db_path, profile, tasks)
+        ready = multiprocessing.Barrier(workers)
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=worker, args=(db_path, profile, seconds, write_ratio, tasks, ready, results)) for _ in range(workers)]
+        for proc in procs:
+            proc.start()
+        stats = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+    reads = [s for stat in stats for s in stat['read']]
+    writes = [s for stat in stats for s in stat['write']]
+    errors = sum(stat['errors'] for stat in stats)
+
+    def p99(samples):
+        return statistics.quantiles(samples, n=100)[98] * 1000 if len(samples) > 1 else float('nan')
+    print(f'{profile:<10}{len(reads) / seconds:>10.0f}{len(writes) / seconds:>10.0f}{errors:>10}{p99(reads):>12.1f}{p99(writes):>12.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.3)
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'wal'])
+    args = parser.parse_args()
+
+    print(f'{args.workers} workers, {args.seconds:g}s, {args.write_ratio:.0%} writes')
+    print(f"{'profile':<10}{'reads/s':>10}{'writes/s':>10}{'failed':>10}{'read p99':>12}{'write p99':>12}")
+    for profile in args.profiles:
+        run(profile, args.workers, args.seconds, args.write_ratio, args.tasks)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Time a serverless cold start: interpreter up to the first /api/tasks response.
+
+Each sample runs in a fresh interpreter, the way Vercel starts api/index.py:
+import the swify package, build the app with create_app(), then serve one
+GET /api/tasks. "fresh" samples start from an empty database, so they include
+creating the schema; "current" samples reuse an up-to-date one, which is the
+common case and should cost a single schema query.
+
+    python benchmarks/bench_startup.py --runs 10 --max-ms 1500
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter; phases are measured from its first line
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from swify import create_app
+imported = time.perf_counter()
+app = create_app({{'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + {db!r}, 'UPLOAD_FOLDER': {uploads!r}}})
+created = time.perf_counter()
+response = app.test_client().get('/api/tasks', headers={{'X-User-ID': 'user0'}})
+assert response.status_code == 200, response.status_code
+done = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'create_app': created - imported, 'first_response': done - created,
+                  'pillow_loaded': 'PIL' in sys.modules}}))
+'''
+
+
+def sample(db, uploads):
+    code = CHILD.format(root=ROOT, db=db, uploads=uploads)
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    wall = time.perf_counter() - start
+    phases = json.loads(out.splitlines()[-1])
+    return {'wall': wall, **phases}
+
+
+def seed(db, uploads, tasks):
+    # Built in a child as well, so this process never imports the app it is timing
+    code = f'''
+import sys
+sys.path.insert(0, {ROOT!r})
+from swify import create_app
+from swify.models import db, Task
+app = create_app({{'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + {db!r}, 'UPLOAD_FOLDER': {uploads!r}}})
+with app.app_context():
+    db.session.add_all(Task(title=f'task {{i}}', user_id='user0', priority_rank=i % 3 + 1) for i in range({tasks}))
+    db.session.commit()
+'''
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def report(name, samples):
+    print(f'{name:<10}' + ''.join(f'{statistics.median(s[key] for s in samples) * 1000:>15.1f}' for key in ('import', 'create_app', 'first_response', 'wall')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=200, help='tasks on the board served by the first response')
+    parser.add_argument('--max-ms', type=float, help='fail if the median wall time of a current-schema start exceeds this')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uploads = os.path.join(tmp, 'uploads')
+        fresh = []
+        for i in range(args.runs):
+            fresh.append(sample(os.path.join(tmp, f'fresh{i}.db'), uploads))
+        current_db = os.path.join(tmp, 'current.db')
+        seed(current_db, uploads, args.tasks)
+        current = [sample(current_db, uploads) for _ in range(args.runs)]
+        shutil.rmtree(uploads, ignore_errors=True)
+
+    print(f'median of {args.runs} runs, ms')
+    print(f"{'schema':<10}{'import':>15}{'create_app':>15}{'first response':>15}{'wall':>15}")
+    report('fresh', fresh)
+    report('current', current)
+    if any(s['pillow_loaded'] for s in fresh + current):
+        print('warning: Pillow was imported during startup')
+
+    wall_ms = statistics.median(s['wall'] for s in current) * 1000
+    if args.max_ms is not None and wall_ms > args.max_ms:
+        print(f'FAIL: current-schema cold start {wall_ms:.1f}ms exceeds {args.max_ms:.1f}ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
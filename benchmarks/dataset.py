@@ -0,0 +1,105 @@
+"""Build a reproducible synthetic swify database for benchmarks.
+
+Tasks and subtasks go through POST /api/tasks/batch and attachments through
+the storage layer, so counters, tags, the search index, change sequences and
+blob reference counts are all maintained exactly as in production. The same
+arguments and --seed always produce the same data.
+
+    python benchmarks/dataset.py --out /tmp/bench.db --users 10 --tasks 500 --subtasks 5 --attachments 1
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SYLLABLES = 'ba be bi bo bu ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no nu ra re ri ro ru sa se si so su ta te ti to tu'.split()
+CATEGORIES = ['Personal', 'Work', 'TO-DO']
+PRIORITIES = ['High', 'Medium', 'Low']
+COLORS = ['default', 'red', 'blue', 'green']
+BATCH = 500
+# Distinct files attachments are drawn from; content addressing shares them like real duplicate uploads
+BLOB_POOL = 16
+
+
+def words(rng, vocabulary, count):
+    return ' '.join(rng.choice(vocabulary) for _ in range(count))
+
+
+def make_app(db_path, uploads, **config):
+    sys.path.insert(0, ROOT)
+    from swify import create_app
+    return create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'UPLOAD_FOLDER': uploads, 'THUMBNAIL_WORKERS': 1, **config})
+
+
+def blob_files(rng, count):
+    # Half the pool are small PNGs when Pillow is available, so thumbnails have something to work on
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    for i in range(count):
+        if Image is not None and i % 2 == 0:
+            buf = io.BytesIO()
+            Image.new('RGB', (rng.randint(200, 1200), rng.randint(200, 1200)), tuple(rng.randrange(256) for _ in range(3))).save(buf, 'PNG')
+            yield f'image{i}.png', buf.getvalue()
+        else:
+            yield f'notes{i}.txt', rng.randbytes(rng.randint(1, 64) * 1024)
+
+
+def build(app, users, tasks, subtasks, attachments, description_size, seed=0):
+    from swify.models import db, Task, Attachment
+    from swify.storage import store_upload, detect_file_type
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(2000)]
+    client = app.test_client()
+    for user in range(users):
+        headers = {'X-User-ID': f'user{user}'}
+        for start in range(0, tasks, BATCH):
+            ops = [{'op': 'create', 'task': {
+                'title': words(rng, vocabulary, rng.randint(2, 6)),
+                'description': words(rng, vocabulary, description_size // 6)[:description_size],
+                'category': rng.choice(CATEGORIES),
+                'priority': rng.choice(PRIORITIES),
+                'color': rng.choice(COLORS),
+                'tags': ','.join(rng.sample(vocabulary[:30], rng.randint(0, 3))),
+                'due_date': f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}' if rng.random() < 0.6 else None,
+            }, 'subtasks': [{'op': 'create', 'text': words(rng, vocabulary, rng.randint(1, 4)), 'completed': rng.random() < 0.3} for _ in range(subtasks)]}
+                for _ in range(start, min(tasks, start + BATCH))]
+            response = client.post('/api/tasks/batch', json={'ops': ops}, headers=headers)
+            assert response.status_code == 200, response.get_data(as_text=True)
+    if not attachments:
+        return
+    with app.app_context():
+        pool = [(store_upload(io.BytesIO(data), name), name) for name, data in blob_files(rng, BLOB_POOL)]
+        db.session.commit()
+        for user in range(users):
+            for task in Task.query.filter_by(user_id=f'user{user}').order_by(Task.id):
+                for blob, name in rng.sample(pool, min(attachments, len(pool))):
+                    db.session.add(Attachment(file_path=f'uploads/{blob.path}', file_type=detect_file_type(name), blob_sha256=blob.sha256, task=task))
+            db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', required=True, help='SQLite file to create; uploads go next to it')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=500, help='per user')
+    parser.add_argument('--subtasks', type=int, default=5, help='per task')
+    parser.add_argument('--attachments', type=int, default=1, help='per task')
+    parser.add_argument('--description-size', type=int, default=200, help='characters')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if os.path.exists(args.out):
+        sys.exit(f'{args.out} already exists')
+    start = time.perf_counter()
+    app = make_app(os.path.abspath(args.out), os.path.join(os.path.dirname(os.path.abspath(args.out)), 'uploads'))
+    build(app, args.users, args.tasks, args.subtasks, args.attachments, args.description_size, args.seed)
+    print(f'{args.users * args.tasks} tasks written to {args.out} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
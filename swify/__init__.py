@@ -0,0 +1,94 @@
+import os
+from datetime import timedelta
+from flask import Flask
+from flask_cors import CORS
+from .models import db
+from .engine import configure_sqlite
+from .schema import migrate_database
+from .metrics import Metrics, start_request, record_request
+from .sync import ResponseCache
+from .reminders import Reminders
+from .events import EventHub
+from .serialize import FastJSONProvider
+from .storage import gc_uploads
+from .routes import api
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Databases already brought up to date by this process, so repeated create_app calls skip the check
+migrated = {}
+
+def default_config():
+    # Vercel handling: SQLite must be in /tmp for write access in serverless functions
+    if os.environ.get('VERCEL') or os.environ.get('VERCEL_ENV'):
+        db_path = '/tmp/todo_v3.db'
+        upload_folder = '/tmp/uploads'
+    else:
+        db_path = os.path.join(PROJECT_ROOT, 'todo_v3.db')
+        upload_folder = os.path.join(PROJECT_ROOT, 'static', 'uploads')
+    return {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'UPLOAD_FOLDER': upload_folder,
+        'MAX_CONTENT_LENGTH': 16 * 1024 * 1024,  # 16MB max upload
+        'UPLOAD_CHUNK_BYTES': 4 * 1024 * 1024,
+        'MAX_UPLOAD_BYTES': int(os.environ.get('MAX_UPLOAD_BYTES', 1024 * 1024 * 1024)),
+        'THUMBNAIL_FORMAT': os.environ.get('THUMBNAIL_FORMAT', 'webp'),
+        'THUMBNAIL_WORKERS': 2,
+        # Optional proxy offload for upload bytes: 'x-accel' (nginx internal location at UPLOAD_ACCEL_PREFIX)
+        # or 'x-sendfile' (Apache/lighttpd); by default Flask streams them itself
+        'UPLOAD_OFFLOAD': os.environ.get('UPLOAD_OFFLOAD', ''),
+        'UPLOAD_ACCEL_PREFIX': os.environ.get('UPLOAD_ACCEL_PREFIX', '/protected-uploads/'),
+        # SQLite connection settings, see engine.SQLITE_PROFILES
+        'SQLITE_PROFILE': os.environ.get('SQLITE_PROFILE', 'wal'),
+        'SQLITE_WRITE_RETRIES': 3,
+        'RESPONSE_CACHE_BYTES': int(os.environ.get('RESPONSE_CACHE_BYTES', 32 * 1024 * 1024)),
+        # Log requests slower than this with their SQL statements; 0 turns the slow-request log off
+        'SLOW_REQUEST_MS': int(os.environ.get('SLOW_REQUEST_MS', 0)),
+        # How far ahead each process keeps due tasks in memory for /api/reminders/upcoming
+        'REMINDER_WINDOW_HOURS': float(os.environ.get('REMINDER_WINDOW_HOURS', 24)),
+        # Change feed (GET /api/events): how often each process checks for commits made by other processes,
+        # the idle interval between heartbeats, and how long notifications are kept. Every open stream holds
+        # a worker thread, so run threaded workers (gunicorn -k gthread) sized for the expected connections.
+        'EVENTS_POLL_SECONDS': float(os.environ.get('EVENTS_POLL_SECONDS', 0.5)),
+        'EVENTS_HEARTBEAT_SECONDS': float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15)),
+        'EVENTS_RETENTION_SECONDS': int(os.environ.get('EVENTS_RETENTION_SECONDS', 300)),
+        # ASGI mode (swify.asgi): worker threads running Flask views, threads for blocking file writes,
+        # and how much of a request body is buffered in memory before spooling to disk
+        'ASGI_WORKERS': int(os.environ.get('ASGI_WORKERS', 8)),
+        'FILE_IO_WORKERS': int(os.environ.get('FILE_IO_WORKERS', 4)),
+        'ASGI_SPOOL_BYTES': 1024 * 1024,
+    }
+
+def create_app(config=None):
+    # root_path is the project root so static/ and templates/ resolve as they did for app.py
+    app = Flask(__name__, root_path=PROJECT_ROOT)
+    app.json = FastJSONProvider(app)
+    app.config.update(default_config())
+    if config:
+        app.config.update(config)
+    app.config['USE_X_SENDFILE'] = app.config['UPLOAD_OFFLOAD'] == 'x-sendfile'
+    CORS(app)
+
+    # Ensure upload directory exists
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    db.init_app(app)
+    app.extensions['response_cache'] = ResponseCache(app.config['RESPONSE_CACHE_BYTES'])
+    app.extensions['metrics'] = Metrics()
+    app.extensions['reminders'] = Reminders(timedelta(hours=app.config['REMINDER_WINDOW_HOURS']))
+    app.extensions['events'] = EventHub(app.config['EVENTS_POLL_SECONDS'], app.config['EVENTS_HEARTBEAT_SECONDS'],
+                                        timedelta(seconds=app.config['EVENTS_RETENTION_SECONDS']))
+    app.register_blueprint(api)
+    # Registered before configure_sqlite's begin_write so request timing includes waiting for the write lock
+    app.before_request(start_request)
+    app.after_request(record_request)
+    app.cli.add_command(gc_uploads)
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    with app.app_context():
+        configure_sqlite(app)
+        if uri not in migrated:
+            migrated[uri] = migrate_database()
+    app.config['SEARCH_FTS'] = migrated[uri]
+    return app
@@ -0,0 +1,232 @@
+import sys
+import time
+import asyncio
+import contextvars
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_etags
+from . import create_app
+from .models import UserSequence
+from .events import HEARTBEAT, opening
+from .sync import list_cache_key
+
+# ASGI serving mode (uvicorn asgi:app). The Flask views stay the single implementation of every route;
+# what changes is who waits on the network. Request bodies are received on the event loop and spooled
+# to a temporary file, large ones written through a small file I/O pool, and only a complete request is
+# handed to the Flask app on a bounded worker pool. A slow client uploading an attachment therefore
+# holds no worker thread while it trickles in, and cheap requests do not queue behind it. Two routes
+# never need a worker: task list cache hits (and 304s), whose version check is one aiosqlite query,
+# and the event stream, which waits on the event loop instead of holding a thread per connection.
+# Needs the packages in requirements-asgi.txt.
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+JSON_HEADERS = [(b'content-type', b'application/json')]
+
+class SwifyASGI:
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self.workers = ThreadPoolExecutor(app.config['ASGI_WORKERS'], thread_name_prefix='swify-wsgi')
+        self.file_io = ThreadPoolExecutor(app.config['FILE_IO_WORKERS'], thread_name_prefix='swify-file-io')
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        self.engine = create_async_engine(uri.replace('sqlite://', 'sqlite+aiosqlite://', 1)) if uri.startswith('sqlite://') else None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        if scope['method'] == 'GET' and self.engine is not None:
+            if scope['path'] == '/api/tasks' and await self.cached_tasks(scope, send):
+                return
+            if scope['path'] == '/api/events':
+                return await self.events(scope, receive, send)
+        body = await self.receive_body(scope, receive, send)
+        if body is not None:
+            await self.call_wsgi(scope, body, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.workers.shutdown(wait=False)
+                self.file_io.shutdown(wait=False)
+                if self.engine is not None: await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def current_seq(self, user_id):
+        async with self.engine.connect() as conn:
+            return await conn.scalar(select(UserSequence.seq).where(UserSequence.user_id == user_id)) or 0
+
+    async def receive_body(self, scope, receive, send):
+        # Spooled in memory up to ASGI_SPOOL_BYTES, then on disk; None when the client gave up or sent too much
+        loop = asyncio.get_running_loop()
+        body = tempfile.SpooledTemporaryFile(max_size=self.config['ASGI_SPOOL_BYTES'])
+        size, limit, spool = 0, self.config['MAX_CONTENT_LENGTH'], self.config['ASGI_SPOOL_BYTES']
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if limit and size > limit:
+                body.close()
+                await respond(send, 413, b'{"error":"Request body too large"}\n', JSON_HEADERS)
+                return None
+            # Once the spool has rolled over to disk, writes go through the file I/O pool
+            if chunk and size - len(chunk) > spool:
+                await loop.run_in_executor(self.file_io, body.write, chunk)
+            elif chunk:
+                body.write(chunk)
+            if not message.get('more_body'):
+                body.seek(0)
+                return body
+
+    def environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+            'PATH_INFO': scope['path'].encode().decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = 'HTTP_' + name
+            environ[name] = f'{environ[name]},{value}' if name in environ else value
+        # The spooled body is complete, whatever framing the client used
+        environ['CONTENT_LENGTH'] = str(body.seek(0, 2))
+        body.seek(0)
+        return environ
+
+    async def call_wsgi(self, scope, body, send):
+        loop = asyncio.get_running_loop()
+        started = {}
+        # Every hop of one response runs in the same copied context: stream_with_context keeps Flask's request
+        # and app context in context variables, which a hop running in a fresh context would not see
+        context = contextvars.copy_context()
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+        def first_chunk():
+            result = self.app(self.environ(scope, body), start_response)
+            iterator = iter(result)
+            return result, iterator, next(iterator, None)
+
+        try:
+            result, iterator, chunk = await loop.run_in_executor(self.workers, context.run, first_chunk)
+        except BaseException:
+            body.close()
+            raise
+        try:
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                # Streamed bodies (ndjson lists, file downloads) are pulled one chunk per worker hop
+                chunk = await loop.run_in_executor(self.workers, context.run, next, iterator, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.workers, context.run, result.close)
+            body.close()
+
+    async def cached_tasks(self, scope, send):
+        # GET /api/tasks answered from the response cache without a worker; False leaves it to Flask
+        start = time.perf_counter()
+        args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        if args.get('stream'):
+            return False
+        headers = request_headers(scope)
+        user_id = headers.get('x-user-id', 'default')
+        cache_key, etag = list_cache_key(user_id, await self.current_seq(user_id), args)
+        etag_header = [(b'etag', f'"{etag}"'.encode())]
+        if etag in parse_etags(headers.get('if-none-match')):
+            status = 304
+            await respond(send, status, b'', etag_header)
+        else:
+            body = self.app.extensions['response_cache'].get(cache_key, count_miss=False)
+            if body is None:
+                return False
+            status = 200
+            await respond(send, status, body, etag_header + JSON_HEADERS)
+        self.app.extensions['metrics'].observe('GET', '/api/tasks', status, time.perf_counter() - start, 1, 0, 0, 0, 0)
+        return True
+
+    async def events(self, scope, receive, send):
+        # The same stream as the Flask view, with the wait on the event loop
+        args = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+        headers = request_headers(scope)
+        user_id = headers.get('x-user-id') or args.get('user_id', 'default')
+        since = headers.get('last-event-id') or args.get('since')
+        if since is not None and not since.isdigit():
+            return await respond(send, 400, b'{"error":"Invalid event id"}\n', JSON_HEADERS)
+        loop = asyncio.get_running_loop()
+        hub = self.app.extensions['events']
+
+        def subscribe():
+            with self.app.app_context():
+                return hub.subscribe(self.app, user_id)
+
+        sub = await loop.run_in_executor(self.workers, subscribe)
+        woken = asyncio.Event()
+        sub.waker = lambda: loop.call_soon_threadsafe(woken.set)
+        disconnected = asyncio.ensure_future(wait_disconnect(receive))
+        waiting = None
+        try:
+            sub.seq = await self.current_seq(user_id)
+            await send({'type': 'http.response.start', 'status': 200, 'headers': CORS_HEADERS + [
+                (b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+            await send({'type': 'http.response.body', 'body': opening(sub, int(since) if since is not None else None).encode(), 'more_body': True})
+            while True:
+                waiting = waiting or asyncio.ensure_future(woken.wait())
+                await asyncio.wait({waiting, disconnected}, timeout=hub.heartbeat_seconds, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    break
+                if not waiting.done():
+                    await send({'type': 'http.response.body', 'body': HEARTBEAT.encode(), 'more_body': True})
+                    continue
+                waiting = None
+                woken.clear()
+                chunk = sub.drain()
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        finally:
+            hub.unsubscribe(sub)
+            for task in (waiting, disconnected):
+                if task is not None: task.cancel()
+
+def request_headers(scope):
+    return {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def respond(send, status, body, headers=()):
+    await send({'type': 'http.response.start', 'status': status, 'headers': CORS_HEADERS + list(headers) + [(b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+def create_asgi_app(config=None):
+    return SwifyASGI(create_app(config))
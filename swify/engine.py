@@ -0,0 +1,90 @@
+import time
+from flask import current_app, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from .models import db
+
+# Connection settings applied to every new SQLite connection, by SQLITE_PROFILE.
+# 'default' leaves pysqlite alone (rollback journal, deferred transactions);
+# 'wal' lets readers run alongside the single writer and makes writers queue instead of failing.
+SQLITE_PROFILES = {
+    'default': {},
+    'wal': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,  # ms a writer waits for the lock before SQLITE_BUSY
+        'synchronous': 'NORMAL',  # WAL stays consistent; only the last commits may be lost on power failure
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -32000,  # negative means KiB: 32 MB page cache per connection
+        'temp_store': 'MEMORY',
+    },
+}
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+def is_busy(error):
+    return 'locked' in str(error.orig) or 'busy' in str(error.orig)
+
+def configure_sqlite(app):
+    engine = db.engines[None]
+    pragmas = SQLITE_PROFILES[app.config['SQLITE_PROFILE']]
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        # Take over transaction control from pysqlite so BEGIN can be chosen per transaction below
+        dbapi_connection.isolation_level = None
+        for name, value in pragmas.items():
+            dbapi_connection.execute(f'PRAGMA {name} = {value}')
+
+    @event.listens_for(engine, 'begin')
+    def begin(conn):
+        # A deferred transaction that later writes has to upgrade its lock, and SQLite fails that upgrade
+        # immediately instead of waiting. Writes take the lock up front; reads stay deferred and never block in WAL.
+        # Background readers outside a request mark their connection with execution_options(read_only=True),
+        # and streams_body views ask for their write transaction with execution_options(write=True).
+        options = conn.get_execution_options()
+        if options.get('read_only') or options.get('write'):
+            writing = bool(options.get('write'))
+        else:
+            writing = not has_request_context() or (request.method not in READ_METHODS and not streams_request_body())
+        conn.exec_driver_sql('BEGIN IMMEDIATE' if writing else 'BEGIN')
+
+    app.before_request(begin_write)
+
+def streams_body(view):
+    # For views that do slow work of their own (copying request.stream, hashing a file) before writing:
+    # their body is not buffered up front and their transactions stay deferred, so the slow part holds
+    # no lock. Those that write end their read transaction and call open_write() once the slow part is done.
+    view.streams_body = True
+    return view
+
+def streams_request_body():
+    return getattr(current_app.view_functions.get(request.endpoint), 'streams_body', False)
+
+def begin_write():
+    # Open the write transaction before the view runs, so a database still busy after busy_timeout
+    # is retried here, where nothing has happened yet, instead of failing halfway through a request
+    if request.method in READ_METHODS or streams_request_body():
+        return None
+    # Receive the whole body first (form fields and files parsed, anything else cached for get_json):
+    # a slow client then holds its own worker, not SQLite's single write lock
+    request.get_data(parse_form_data=True)
+    return open_write()
+
+def open_write():
+    # None once the session holds a write transaction, or a 503 response when the database stayed busy
+    retries = current_app.config['SQLITE_WRITE_RETRIES']
+    for attempt in range(retries + 1):
+        try:
+            db.session.connection(execution_options={'write': True})
+            return None
+        except OperationalError as e:
+            db.session.rollback()
+            if not is_busy(e):
+                raise
+            if attempt < retries:
+                time.sleep(0.05 * 2 ** attempt)
+    response = jsonify({'error': 'Database busy, try again'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
@@ -0,0 +1,190 @@
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from .models import db, Notification
+
+logger = logging.getLogger(__name__)
+
+# Change feed for GET /api/events. Write transactions insert one notification row per user they touched
+# ({"seq", "changes": [{"entity", "id", "op", ...}]}) next to the change itself, so the event exists
+# exactly when the change commits. Each process runs one poller thread that reads new rows by id and
+# hands them to that user's open streams; a commit in this process wakes it at once, commits elsewhere
+# are seen within EVENTS_POLL_SECONDS. Clients that fall behind are told to resync through /api/changes.
+# Rows older than EVENTS_RETENTION_SECONDS are pruned by the writes themselves, so the table stays bounded
+# in processes that never serve a stream.
+MAX_PENDING = 256  # events queued for one slow stream before it is sent a resync instead
+POLL_BATCH = 1000
+PRUNE_EVERY = timedelta(seconds=60)
+RETRY_MS = 3000
+HEARTBEAT = ': heartbeat\n\n'
+
+def sse(kind, data, id=None):
+    return (f'id: {id}\n' if id is not None else '') + f'event: {kind}\ndata: {data}\n\n'
+
+class Subscriber:
+    # One open stream: a queue and a flag its request thread sleeps on, nothing else
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.seq = 0  # last sequence the client has been sent or told to resync to
+        self.queue = deque()
+        self.ready = threading.Event()
+        self.overflowed = False
+        self.waker = None  # set by streams that wait on something other than self.ready
+
+    def push(self, item):
+        if len(self.queue) >= MAX_PENDING:
+            self.overflowed = True
+            self.queue.clear()
+        else:
+            self.queue.append(item)
+        self.ready.set()
+        if self.waker is not None: self.waker()
+
+    def drain(self):
+        # Everything queued as one chunk of SSE text, '' when nothing new was waiting
+        chunks = []
+        if self.overflowed:
+            self.overflowed = False
+            chunks.append(sse('resync', json.dumps({'since': self.seq})))
+        while self.queue:
+            kind, seq, data = self.queue.popleft()
+            if seq is not None:
+                # Already covered by the ready sequence or a resync
+                if seq <= self.seq: continue
+                self.seq = seq
+            chunks.append(sse(kind, data, seq))
+        return ''.join(chunks)
+
+class EventHub:
+    def __init__(self, poll_seconds, heartbeat_seconds, retention):
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.retention = retention
+        self.subscribers = {}  # user_id -> set of Subscriber
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.last_id = None
+        self.thread = None
+        self.pruned = datetime.min
+
+    def subscribe(self, app, user_id):
+        sub = Subscriber(user_id)
+        with self.lock:
+            if self.thread is None:
+                # Start from the current end of the table, before this stream reads its sequence
+                self.last_id = self.read(lambda conn: conn.execute(db.select(db.func.coalesce(db.func.max(Notification.id), 0))).scalar())
+                self.thread = threading.Thread(target=self.run, args=(app,), name='swify-events', daemon=True)
+                self.thread.start()
+                app.extensions['reminders'].subscribe(app, self.remind)
+            self.subscribers.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            subs = self.subscribers.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs: del self.subscribers[sub.user_id]
+
+    def deliver(self, user_id, item):
+        with self.lock:
+            subs = list(self.subscribers.get(user_id, ()))
+        for sub in subs:
+            sub.push(item)
+
+    def wake(self):
+        self.wakeup.set()
+
+    def remind(self, due_date, task_id, user_id, title):
+        self.deliver(user_id, ('reminder', None, json.dumps({'id': task_id, 'title': title, 'due_date': due_date.isoformat()})))
+
+    def read(self, query):
+        # The poller only reads; left to the engine's begin hook it would take the write lock every poll
+        with db.engine.connect().execution_options(read_only=True) as conn:
+            return query(conn)
+
+    def poll(self):
+        stmt = db.select(Notification.id, Notification.user_id, Notification.seq, Notification.payload).where(Notification.id > self.last_id).order_by(Notification.id).limit(POLL_BATCH)
+        rows = self.read(lambda conn: conn.execute(stmt).all())
+        for id, user_id, seq, payload in rows:
+            self.deliver(user_id, ('change', seq, payload))
+        if rows:
+            self.last_id = rows[-1].id
+        return len(rows) == POLL_BATCH
+
+    def prune_due(self, now):
+        # At most one prune per PRUNE_EVERY in this process, by whichever write gets there first
+        with self.lock:
+            if now - self.pruned < PRUNE_EVERY:
+                return False
+            self.pruned = now
+            return True
+
+    def prune(self, conn, now):
+        conn.execute(Notification.__table__.delete().where(Notification.created_at < now - self.retention))
+
+    def run(self, app):
+        with app.app_context():
+            while True:
+                self.wakeup.wait(self.poll_seconds)
+                self.wakeup.clear()
+                try:
+                    while self.poll():
+                        pass
+                except OperationalError:
+                    logger.exception('Polling notifications failed')
+
+def opening(sub, since):
+    text = f'retry: {RETRY_MS}\n' + sse('ready', json.dumps({'seq': sub.seq}))
+    return text + sse('resync', json.dumps({'since': since, 'seq': sub.seq})) if since is not None and since < sub.seq else text
+
+def stream(hub, sub, since):
+    yield opening(sub, since)
+    while True:
+        if not sub.ready.wait(hub.heartbeat_seconds):
+            # Keeps proxies from closing an idle stream, and finds out when the client has gone
+            yield HEARTBEAT
+            continue
+        sub.ready.clear()
+        chunk = sub.drain()
+        if chunk:
+            yield chunk
+
+def publish(session, events):
+    # events: {(user_id, seq): [change, ...]}; written on the flushing transaction's connection
+    if not events: return
+    rows = [{'user_id': user_id, 'seq': seq, 'payload': json.dumps({'seq': seq, 'changes': changes}, separators=(',', ':'))}
+            for (user_id, seq), changes in events.items()]
+    conn = session.connection()
+    hub = current_app.extensions.get('events') if has_app_context() else None
+    now = datetime.utcnow()
+    if hub is not None and hub.prune_due(now):
+        # Already holding the write lock, so this costs one indexed delete every PRUNE_EVERY
+        hub.prune(conn, now)
+    conn.execute(Notification.__table__.insert(), rows)
+    session.info['published'] = True
+
+@event.listens_for(Session, 'after_flush')
+def publish_flushed_changes(session, flush_context):
+    flushed = session.info.pop('flushed_changes', None)
+    if not flushed: return
+    events = {}
+    for user_id, seq, entity, obj, op in flushed:
+        events.setdefault((user_id, seq), []).append({'entity': entity, 'id': obj.id, 'op': op})
+    publish(session, events)
+
+@event.listens_for(Session, 'after_commit')
+def wake_hub(session):
+    if session.info.pop('published', None) and has_app_context() and 'events' in current_app.extensions:
+        current_app.extensions['events'].wake()
+
+@event.listens_for(Session, 'after_rollback')
+def drop_published(session):
+    session.info.pop('published', None)
+    session.info.pop('flushed_changes', None)
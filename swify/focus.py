@@ -0,0 +1,91 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import cast, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from .models import db, Task, FocusSession, FocusRollup, parse_tags
+
+# Focus-session log. Sessions are written once when they start and closed by one conditional UPDATE;
+# closing also adds the session to its day and week rollups per (category, tag) in one upsert, so the
+# analytics endpoint reads O(buckets) rollup rows and never the sessions themselves. Days are the
+# server's local days, like due dates.
+PERIODS = ('day', 'week')
+MAX_BUCKETS = 366
+
+def period_start(period, day):
+    return day - timedelta(days=day.weekday()) if period == 'week' else day
+
+def start_session(user_id, data):
+    # Returns the new session, or None when the user already has one open
+    category, tags, planned = data.get('category') or '', data.get('tags'), data.get('planned_minutes')
+    task_id = data.get('task_id')
+    if task_id is not None:
+        task = db.session.execute(db.select(Task.category, Task.tags, Task.focus_duration).where(Task.id == task_id, Task.user_id == user_id)).first()
+        if task is None: raise LookupError('Task not found')
+        category, tags, planned = task.category or '', task.tags, planned or task.focus_duration
+    session = FocusSession(user_id=user_id, task_id=task_id, category=category, tags=tags, planned_minutes=planned, started_at=datetime.now())
+    db.session.add(session)
+    try:
+        # uq_focus_session_open turns a second open session into an IntegrityError
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return None
+    return session
+
+def open_session(user_id):
+    return FocusSession.query.filter(FocusSession.user_id == user_id, FocusSession.ended_at.is_(None)).first()
+
+def finish_session(id, user_id, completed, seconds=None):
+    # Closes an open session and adds it to the rollups; None when there is no such open session.
+    # Reported seconds (time actually focused, pauses excluded) are capped at the wall-clock duration.
+    now = datetime.now()
+    table = FocusSession.__table__
+    elapsed = func.max(cast((func.julianday(now) - func.julianday(table.c.started_at)) * 86400, db.Integer), 0)
+    focused = func.min(seconds, elapsed) if seconds is not None else elapsed
+    row = db.session.execute(table.update().where(table.c.id == id, table.c.user_id == user_id, table.c.ended_at.is_(None))
+                             .values(ended_at=now, seconds=focused, completed=completed)
+                             .returning(table.c.started_at, table.c.category, table.c.tags, table.c.seconds)).first()
+    if row is None: return None
+    day = row.started_at.date()
+    rows = [{'user_id': user_id, 'period': period, 'period_start': period_start(period, day), 'category': row.category or '', 'tag': tag,
+             'sessions': 1, 'completed': int(completed), 'seconds': row.seconds}
+            for period in PERIODS for tag in [''] + parse_tags(row.tags)]
+    stmt = sqlite_insert(FocusRollup).values(rows)
+    db.session.execute(stmt.on_conflict_do_update(index_elements=['user_id', 'period', 'period_start', 'category', 'tag'], set_={
+        'sessions': FocusRollup.sessions + stmt.excluded.sessions,
+        'completed': FocusRollup.completed + stmt.excluded.completed,
+        'seconds': FocusRollup.seconds + stmt.excluded.seconds,
+    }))
+    return db.session.get(FocusSession, id, populate_existing=True)
+
+def bucket_starts(period, start, end):
+    step = timedelta(days=7 if period == 'week' else 1)
+    current = period_start(period, start)
+    while current <= end:
+        yield current
+        current += step
+
+def focus_stats(user_id, period, start, end, by):
+    # Buckets from start to end inclusive, each with its totals and a breakdown by category or tag
+    query = db.select(FocusRollup.period_start, FocusRollup.category, FocusRollup.tag, FocusRollup.sessions, FocusRollup.completed, FocusRollup.seconds).where(
+        FocusRollup.user_id == user_id, FocusRollup.period == period,
+        FocusRollup.period_start >= period_start(period, start), FocusRollup.period_start <= end)
+    if by == 'category': query = query.where(FocusRollup.tag == '')
+    empty = lambda: {'sessions': 0, 'completed': 0, 'seconds': 0}
+    buckets = {day: dict(empty(), groups={}) for day in bucket_starts(period, start, end)}
+    totals = dict(empty(), groups={})
+    for day, category, tag, sessions, completed, seconds in db.session.execute(query):
+        bucket = buckets[day]
+        # tag '' rows are the whole category, so they make up the totals whichever breakdown is asked for
+        targets = [bucket, totals] if tag == '' else []
+        if (by == 'category') == (tag == ''):
+            key = category if by == 'category' else tag
+            targets += [bucket['groups'].setdefault(key, empty()), totals['groups'].setdefault(key, empty())]
+        for target in targets:
+            target['sessions'] += sessions
+            target['completed'] += completed
+            target['seconds'] += seconds
+    return [dict(values, start=day.isoformat()) for day, values in buckets.items()], totals
+
+def parse_day(value, default):
+    return date.fromisoformat(value) if value else default
@@ -0,0 +1,156 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Request instrumentation: every request records its latency, SQL queries and time, relationship loads,
+# JSON bytes and file I/O time. Each response carries them in X-Query-Count and Server-Timing, per-route
+# totals are exported by GET /metrics in Prometheus text format, and with SLOW_REQUEST_MS set, slower
+# requests are logged with the statements they ran. Numbers are per process, like the response cache.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_queries(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+        context.query_start = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def time_queries(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'query_start', None)
+    if start is None or not has_request_context():
+        return
+    elapsed = time.perf_counter() - start
+    g.sql_time = g.get('sql_time', 0) + elapsed
+    if g.get('slow_queries') is not None:
+        g.slow_queries.append((elapsed, statement))
+
+@event.listens_for(Session, 'do_orm_execute')
+def count_relationship_loads(orm_execute_state):
+    # Lazy loads and selectin loads fired by attribute access rather than by an explicit query
+    if orm_execute_state.is_relationship_load and has_request_context():
+        g.relationship_loads = g.get('relationship_loads', 0) + 1
+
+@contextmanager
+def timed(name):
+    # Adds the block's duration to this request's Server-Timing entry called name
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context():
+            timings = g.setdefault('timings', {})
+            timings[name] = timings.get(name, 0) + time.perf_counter() - start
+
+def add_json_bytes(size):
+    if has_request_context():
+        g.json_bytes = g.get('json_bytes', 0) + size
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+class RouteStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.statuses = {}
+        self.sql_seconds = 0
+        self.relationship_loads = 0
+        self.json_bytes = 0
+        self.file_seconds = 0
+
+class Metrics:
+    def __init__(self):
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def observe(self, method, route, status, seconds, queries, sql_seconds, relationship_loads, json_bytes, file_seconds):
+        with self.lock:
+            stats = self.routes.get((method, route))
+            if stats is None:
+                stats = self.routes[(method, route)] = RouteStats()
+            stats.latency.observe(seconds)
+            stats.queries.observe(queries)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.sql_seconds += sql_seconds
+            stats.relationship_loads += relationship_loads
+            stats.json_bytes += json_bytes
+            stats.file_seconds += file_seconds
+
+    def render(self):
+        lines = []
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+        def histogram(name, labels, hist):
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+            lines.append(f'{name}_sum{{{labels}}} {hist.sum}')
+            lines.append(f'{name}_count{{{labels}}} {hist.count}')
+        with self.lock:
+            routes = sorted(self.routes.items())
+            family('swify_requests_total', 'counter', 'Requests by route and status.')
+            for (method, route), stats in routes:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'swify_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+            family('swify_request_duration_seconds', 'histogram', 'Time spent in the view and its hooks, excluding streamed bodies.')
+            for (method, route), stats in routes:
+                histogram('swify_request_duration_seconds', f'method="{method}",route="{route}"', stats.latency)
+            family('swify_sql_queries_per_request', 'histogram', 'SQL statements executed per request.')
+            for (method, route), stats in routes:
+                histogram('swify_sql_queries_per_request', f'method="{method}",route="{route}"', stats.queries)
+            for name, attr, help_text in (
+                ('swify_sql_seconds_total', 'sql_seconds', 'Time spent executing SQL.'),
+                ('swify_relationship_loads_total', 'relationship_loads', 'ORM relationship loads triggered by attribute access.'),
+                ('swify_json_bytes_total', 'json_bytes', 'Bytes of JSON serialized.'),
+                ('swify_file_io_seconds_total', 'file_seconds', 'Time spent copying, hashing and thumbnailing files inside requests.'),
+            ):
+                family(name, 'counter', help_text)
+                for (method, route), stats in routes:
+                    lines.append(f'{name}{{method="{method}",route="{route}"}} {getattr(stats, attr)}')
+        return '\n'.join(lines) + '\n'
+
+def start_request():
+    g.request_start = time.perf_counter()
+    if current_app.config['SLOW_REQUEST_MS']:
+        g.slow_queries = []
+
+def record_request(response):
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    queries, sql_time = g.get('query_count', 0), g.get('sql_time', 0)
+    timings = g.get('timings', {})
+    response.headers['X-Query-Count'] = str(queries)
+    server_timing = [f'sql;dur={sql_time * 1000:.2f};desc="{queries} queries"']
+    server_timing += [f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings.items()]
+    server_timing.append(f'app;dur={elapsed * 1000:.2f}')
+    response.headers['Server-Timing'] = ', '.join(server_timing)
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    current_app.extensions['metrics'].observe(request.method, route, response.status_code, elapsed, queries, sql_time,
+                                              g.get('relationship_loads', 0), g.get('json_bytes', 0), timings.get('file', 0))
+    threshold = current_app.config['SLOW_REQUEST_MS']
+    if threshold and elapsed * 1000 >= threshold:
+        statements = ''.join(f'\n  {seconds * 1000:8.2f}ms  {" ".join(statement.split())}' for seconds, statement in g.get('slow_queries', []))
+        logger.warning('Slow request: %s %s took %.1fms (%d queries, %.1fms SQL)%s', request.method, request.full_path.rstrip('?'), elapsed * 1000, queries, sql_time * 1000, statements)
+    return response
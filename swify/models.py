@@ -0,0 +1,240 @@
+from datetime import datetime
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+# Priority is stored as its sort rank; names only appear in the API
+PRIORITY_RANKS = {'High': 1, 'Medium': 2, 'Low': 3}
+PRIORITY_NAMES = {rank: name for name, rank in PRIORITY_RANKS.items()}
+PRIORITY_ERROR = 'priority must be High, Medium or Low'
+
+# Bounding-box edge lengths of the image thumbnails served to cards and previews
+THUMBNAIL_SIZES = (160, 640)
+
+class Task(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    category = db.Column(db.String(20), default='Personal')
+    priority_rank = db.Column(db.Integer, default=2)
+    completed = db.Column(db.Boolean, default=False)
+    due_date = db.Column(db.DateTime, nullable=True)
+    focus_duration = db.Column(db.Integer, default=25)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # New Keep-like features
+    color = db.Column(db.String(20), default='default')
+    is_pinned = db.Column(db.Boolean, default=False)
+    tags = db.Column(db.String(200), nullable=True)
+    user_id = db.Column(db.String(50), nullable=True) # For multi-user isolation
+    # Repeating tasks: due_date is the first occurrence, see recurrence.py
+    recurrence = db.Column(db.String(20), nullable=True)  # daily, weekly, monthly or custom (days)
+    recurrence_interval = db.Column(db.Integer, nullable=True)  # every N units, 1 when unset
+    recurrence_end = db.Column(db.DateTime, nullable=True)  # last moment an occurrence may fall on
+    # Relationships
+    subtasks = db.relationship('Subtask', backref='task', lazy=True, cascade="all, delete-orphan", order_by='Subtask.position')
+    attachments = db.relationship('Attachment', backref='task', lazy=True, cascade="all, delete-orphan")
+    exceptions = db.relationship('RecurrenceException', backref='task', lazy=True, cascade="all, delete-orphan")
+    tag_set = db.relationship('Tag', secondary='task_tag', lazy=True)
+    seq = db.Column(db.Integer, default=0)
+    # Match the board ordering so SQLite walks the index instead of sorting
+    __table_args__ = (
+        db.Index('ix_task_board', 'user_id', is_pinned.desc(), 'completed', 'priority_rank', 'due_date', created_at.desc()),
+        db.Index('ix_task_board_category', 'user_id', 'category', is_pinned.desc(), 'completed', 'priority_rank', 'due_date', created_at.desc()),
+        db.Index('ix_task_user_seq', 'user_id', 'seq'),
+        db.Index('ix_task_due', 'due_date', 'completed', 'user_id'),
+        # Only repeating series, which can be due in a window whatever their first due date
+        db.Index('ix_task_recurring', 'due_date', 'user_id', sqlite_where=recurrence.isnot(None)),
+    )
+
+    def to_dict(self, children=True):
+        data = {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'category': self.category,
+            'priority': PRIORITY_NAMES.get(self.priority_rank),
+            'completed': self.completed,
+            'due_date': self.due_date.isoformat() if self.due_date else None,
+            'focus_duration': self.focus_duration,
+            'created_at': self.created_at.isoformat(),
+            'color': self.color,
+            'is_pinned': self.is_pinned,
+            'tags': self.tags,
+            'recurrence': self.recurrence,
+            'recurrence_interval': self.recurrence_interval,
+            'recurrence_end': self.recurrence_end.isoformat() if self.recurrence_end else None,
+            'seq': self.seq
+        }
+        if children:
+            data['subtasks'] = [s.to_dict() for s in self.subtasks]
+            data['attachments'] = [a.to_dict() for a in self.attachments]
+        return data
+
+class Attachment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    file_path = db.Column(db.String(200), nullable=False)
+    file_type = db.Column(db.String(50), nullable=True) # image, video, audio, etc.
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False, index=True)
+    seq = db.Column(db.Integer, default=0, index=True)
+    blob_sha256 = db.Column(db.String(64), nullable=True, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'file_path': self.file_path,
+            'file_type': self.file_type,
+            'sha256': self.blob_sha256,
+            'thumbnails': thumbnail_urls(self.blob_sha256, self.file_type),
+            'task_id': self.task_id,
+            'seq': self.seq
+        }
+
+class Subtask(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    text = db.Column(db.String(100), nullable=False)
+    completed = db.Column(db.Boolean, default=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False, index=True)
+    seq = db.Column(db.Integer, default=0, index=True)
+    position = db.Column(db.Integer)
+
+    __table_args__ = (db.Index('ix_subtask_task_position', 'task_id', 'position'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'text': self.text,
+            'completed': self.completed,
+            'task_id': self.task_id,
+            'position': self.position,
+            'seq': self.seq
+        }
+
+class RecurrenceException(db.Model):
+    # One occurrence of a repeating task that was completed or skipped, keyed by when it was due
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
+    due_date = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(10), nullable=False)  # completed or skipped
+    seq = db.Column(db.Integer, default=0, index=True)
+
+    __table_args__ = (db.UniqueConstraint('task_id', 'due_date', name='uq_recurrence_exception_occurrence'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'task_id': self.task_id,
+            'due_date': self.due_date.isoformat(),
+            'status': self.status,
+            'seq': self.seq
+        }
+
+class TaskCount(db.Model):
+    user_id = db.Column(db.String(50), primary_key=True)
+    category = db.Column(db.String(20), primary_key=True)
+    completed = db.Column(db.Boolean, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserSequence(db.Model):
+    user_id = db.Column(db.String(50), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False, default=0)
+
+class Tombstone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(50), nullable=False)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    __table_args__ = (db.Index('ix_tombstone_user_seq', 'user_id', 'seq'),)
+
+# Committed change events for GET /api/events. The table is the broker between worker processes:
+# each process's hub reads new rows by id and fans them out to its own connections.
+class Notification(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(50), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_notification_created_at', 'created_at'),)
+
+class Blob(db.Model):
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    path = db.Column(db.String(200), nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UploadSession(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.String(50), nullable=False)
+    filename = db.Column(db.String(200), nullable=False)
+    size = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class StorageUsage(db.Model):
+    user_id = db.Column(db.String(50), primary_key=True)
+    bytes = db.Column(db.Integer, nullable=False, default=0)
+    files = db.Column(db.Integer, nullable=False, default=0)
+
+class FocusSession(db.Model):
+    # A Pomodoro run; category and tags are copied from the task when it starts so later edits leave stats alone
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(50), nullable=False)
+    task_id = db.Column(db.Integer, nullable=True)
+    category = db.Column(db.String(20), nullable=False, default='')
+    tags = db.Column(db.String(200), nullable=True)
+    planned_minutes = db.Column(db.Integer, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=False)
+    ended_at = db.Column(db.DateTime, nullable=True)
+    seconds = db.Column(db.Integer, nullable=True)  # time actually focused, at most ended_at - started_at
+    completed = db.Column(db.Boolean, nullable=True)  # ran to the end rather than abandoned
+    __table_args__ = (
+        db.Index('ix_focus_session_user_started', 'user_id', 'started_at'),
+        # At most one open session per user
+        db.Index('uq_focus_session_open', 'user_id', unique=True, sqlite_where=ended_at.is_(None)),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'task_id': self.task_id,
+            'category': self.category,
+            'tags': self.tags,
+            'planned_minutes': self.planned_minutes,
+            'started_at': self.started_at.isoformat(),
+            'ended_at': self.ended_at.isoformat() if self.ended_at else None,
+            'seconds': self.seconds,
+            'completed': self.completed
+        }
+
+class FocusRollup(db.Model):
+    # Finished sessions summed per day and per week (period_start is the Monday). tag '' holds the whole
+    # category, since a session with several tags is counted once under each of them.
+    user_id = db.Column(db.String(50), primary_key=True)
+    period = db.Column(db.String(4), primary_key=True)  # day or week
+    period_start = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(20), primary_key=True)
+    tag = db.Column(db.String(200), primary_key=True)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    seconds = db.Column(db.Integer, nullable=False, default=0)
+
+task_tags = db.Table('task_tag',
+    db.Column('task_id', db.Integer, db.ForeignKey('task.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    db.Index('ix_task_tag_tag_id', 'tag_id'))
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(50), nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    # Also serves as the (user_id, name) lookup index
+    __table_args__ = (db.UniqueConstraint('user_id', 'name', name='uq_tag_user_name'),)
+
+def thumbnail_urls(sha256, file_type):
+    if file_type != 'image' or not sha256: return None
+    return {str(size): f'/api/thumbnails/{sha256}/{size}' for size in THUMBNAIL_SIZES}
+
+def parse_tags(tags):
+    # Comma-separated free text to unique, lower-cased tag names
+    return list(dict.fromkeys(t.strip().lower() for t in (tags or '').split(',') if t.strip()))
@@ -0,0 +1,67 @@
+import calendar
+from datetime import timedelta
+from sqlalchemy import or_
+from .models import db, Task, RecurrenceException
+
+# Repeating tasks. A series is a single Task row: due_date is its first occurrence and recurrence,
+# recurrence_interval and recurrence_end describe the rest. Occurrences are generated for the window
+# being read and never stored; completing or skipping one writes a RecurrenceException row keyed by
+# when it was due. Completing the task itself ends the series.
+RECURRENCE_UNITS = {'daily': 'days', 'weekly': 'weeks', 'monthly': 'months', 'custom': 'days'}
+MAX_INTERVAL = 1000
+# Widest window an agenda request may expand
+MAX_WINDOW = timedelta(days=366)
+EXCEPTION_STATUSES = ('completed', 'skipped')
+
+def add_months(anchor, months):
+    # Same day of the month, clamped to the month's length: Jan 31 repeats on Feb 28 and then Mar 31
+    month = anchor.month - 1 + months
+    year, month = anchor.year + month // 12, month % 12 + 1
+    return anchor.replace(year=year, month=month, day=min(anchor.day, calendar.monthrange(year, month)[1]))
+
+def occurrences(anchor, recurrence, interval, until, start, end):
+    # Lazily yields the occurrences in [start, end). Each is computed from the anchor rather than the one
+    # before it, so the series can jump straight to the window: cost follows the window, not the series.
+    interval = interval or 1
+    if RECURRENCE_UNITS[recurrence] == 'months':
+        n = max(0, (start.year - anchor.year) * 12 + start.month - anchor.month - 1) // interval
+        nth = lambda n: add_months(anchor, n * interval)
+    else:
+        step = timedelta(days=interval * (7 if RECURRENCE_UNITS[recurrence] == 'weeks' else 1))
+        n = max(0, -((anchor - start) // step))
+        nth = lambda n: anchor + n * step
+    while True:
+        due = nth(n)
+        if due >= end or (until is not None and due > until): return
+        if due >= start: yield due
+        n += 1
+
+def is_occurrence(task, due):
+    return task.recurrence is not None and due in occurrences(task.due_date, task.recurrence, task.recurrence_interval, task.recurrence_end, due, due + timedelta(microseconds=1))
+
+def series_filter(start, end, user_id=None):
+    # Open series that can have an occurrence in [start, end), read through ix_task_recurring
+    clauses = [Task.recurrence.is_not(None), Task.due_date < end, Task.completed.is_(False),
+               or_(Task.recurrence_end.is_(None), Task.recurrence_end >= start)]
+    return clauses + [Task.user_id == user_id] if user_id is not None else clauses
+
+def expand(start, end, user_id=None):
+    # (due_date, task_id, user_id, title, status) for each occurrence in [start, end); status is None
+    # unless an exception completed or skipped it. Two queries: the series, then their exceptions.
+    series = db.session.execute(db.select(Task.id, Task.user_id, Task.title, Task.due_date, Task.recurrence, Task.recurrence_interval, Task.recurrence_end)
+                                .where(*series_filter(start, end, user_id))).all()
+    if not series: return []
+    exceptions = db.session.execute(db.select(RecurrenceException.task_id, RecurrenceException.due_date, RecurrenceException.status)
+                                    .join(Task).where(*series_filter(start, end, user_id), RecurrenceException.due_date >= start, RecurrenceException.due_date < end))
+    status = {(task_id, due): value for task_id, due, value in exceptions}
+    return [(due, row.id, row.user_id, row.title, status.get((row.id, due)))
+            for row in series for due in occurrences(row.due_date, row.recurrence, row.recurrence_interval, row.recurrence_end, start, end)]
+
+def agenda(start, end, user_id):
+    # Everything due in [start, end): one-off tasks through ix_task_due plus expanded occurrences,
+    # as (due_date, task_id, title, status, recurring) in due order
+    one_off = db.session.execute(db.select(Task.due_date, Task.id, Task.title, Task.completed)
+                                 .where(Task.due_date >= start, Task.due_date < end, Task.user_id == user_id, Task.recurrence.is_(None))).all()
+    items = [(due, task_id, title, 'completed' if completed else None, False) for due, task_id, title, completed in one_off]
+    items += [(due, task_id, title, status, True) for due, task_id, _, title, status in expand(start, end, user_id)]
+    return sorted(items)
@@ -0,0 +1,192 @@
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from .models import db, Task, RecurrenceException, UserSequence
+from .recurrence import expand
+
+logger = logging.getLogger(__name__)
+RETRY_SECONDS = 5  # before the timer thread tries again after a failed load
+
+# Due-date reminders. Each process keeps the open tasks due within the next REMINDER_WINDOW_HOURS in a
+# heap ordered by due date, loaded with one range scan of ix_task_due and updated by the session hooks
+# below as tasks are created, edited, completed or deleted. Writes made by other processes are noticed
+# through the owner's change sequence: a user whose sequence moved past what the heap has seen gets
+# their slice reloaded. Due dates are naive local times, like the ones the API accepts. Repeating tasks
+# contribute each pending occurrence in the window; any change to one reloads its owner's slice, since
+# its occurrences depend on the rule and the exceptions.
+class Reminders:
+    def __init__(self, window):
+        self.window = window
+        self.heap = []  # (due_date, task_id); pairs no longer in self.tasks are skipped lazily
+        self.tasks = {}  # task_id -> (user_id, title, due dates in the heap)
+        self.users = {}  # user_id -> task ids in the heap
+        self.seen = {}  # user_id -> change sequence the heap reflects
+        self.stale = set()  # users whose repeating tasks changed in this process
+        self.start = self.horizon = None  # loaded due dates: start <= due_date < horizon
+        self.listeners = []
+        self.thread = None
+        self.lock = threading.Condition()
+
+    def add(self, task_id, user_id, due_date, title):
+        self.tasks.setdefault(task_id, (user_id, title, set()))[2].add(due_date)
+        self.users.setdefault(user_id, set()).add(task_id)
+        heapq.heappush(self.heap, (due_date, task_id))
+
+    def discard(self, task_id):
+        entry = self.tasks.pop(task_id, None)
+        if entry is not None:
+            self.users[entry[0]].discard(task_id)
+
+    def due_between(self, start, end, user_id=None):
+        # (task_id, user_id, due_date, title) of open one-off tasks and pending occurrences
+        query = db.select(Task.id, Task.user_id, Task.due_date, Task.title).where(Task.due_date >= start, Task.due_date < end, Task.completed.is_(False), Task.recurrence.is_(None))
+        rows = db.session.execute(query.where(Task.user_id == user_id) if user_id is not None else query).all()
+        return rows + [(task_id, owner, due_date, title) for due_date, task_id, owner, title, status in expand(start, end, user_id) if status is None]
+
+    def ensure_window(self, now):
+        # Slides the window forward once half of it has elapsed, dropping what fired or lapsed
+        if self.horizon is not None and now + self.window / 2 <= self.horizon:
+            return
+        start, horizon = now, now + self.window
+        # Sequences first: a write landing in between is then reloaded rather than missed
+        seen = dict(db.session.execute(db.select(UserSequence.user_id, UserSequence.seq)).all())
+        rows = self.due_between(start, horizon)
+        self.heap, self.tasks, self.users = [], {}, {}
+        for task_id, user_id, due_date, title in rows:
+            self.add(task_id, user_id, due_date, title)
+        self.seen, self.stale, self.start, self.horizon = seen, set(), start, horizon
+        self.lock.notify_all()
+
+    def reload_user(self, user_id):
+        # Read before dropping anything, so a failed read leaves the user's slice as it was
+        rows = self.due_between(self.start, self.horizon, user_id)
+        self.stale.discard(user_id)
+        for task_id in list(self.users.get(user_id, ())):
+            self.discard(task_id)
+        for task_id, _, due_date, title in rows:
+            self.add(task_id, user_id, due_date, title)
+
+    def sync_user(self, user_id, seq):
+        if self.seen.get(user_id) == seq and user_id not in self.stale:
+            return
+        self.reload_user(user_id)
+        self.seen[user_id] = seq
+
+    def upcoming(self, user_id, seq, now, within):
+        # The user's open tasks due in [now, now + within); None when that reaches past the loaded window,
+        # which only slides once half of it has passed
+        with self.lock:
+            self.ensure_window(now)
+            end = now + within
+            if end > self.horizon:
+                return None
+            self.sync_user(user_id, seq)
+            entries = [(self.tasks[task_id], task_id) for task_id in self.users.get(user_id, ())]
+            return sorted((due_date, task_id, title) for (_, title, dues), task_id in entries for due_date in dues if now <= due_date < end)
+
+    def apply(self, changes):
+        # Committed task changes from this process: (task_id, user_id, due_date, completed, title, seq, deleted, recurring)
+        with self.lock:
+            if self.horizon is None:
+                return
+            for task_id, user_id, due_date, completed, title, seq, deleted, recurring in changes:
+                self.discard(task_id)
+                if recurring and not deleted:
+                    self.stale.add(user_id)
+                elif not deleted and not completed and due_date is not None and self.start <= due_date < self.horizon:
+                    self.add(task_id, user_id, due_date, title)
+                # Only when no other process wrote in between does the heap still reflect the user exactly
+                if seq is not None and self.seen.get(user_id) in (seq - 1, seq):
+                    self.seen[user_id] = seq
+            self.lock.notify_all()
+
+    def pop_due(self, now):
+        # Removes and returns (due_date, task_id, user_id, title) for every reminder that has come due
+        fired = []
+        while self.heap and self.heap[0][0] <= now:
+            due_date, task_id = heapq.heappop(self.heap)
+            entry = self.tasks.get(task_id)
+            if entry is not None and due_date in entry[2]:
+                entry[2].discard(due_date)
+                if not entry[2]: self.discard(task_id)
+                fired.append((due_date, task_id, entry[0], entry[1]))
+        return fired
+
+    def subscribe(self, app, callback):
+        # callback(due_date, task_id, user_id, title) runs on the timer thread as each reminder comes due
+        with self.lock:
+            self.listeners.append(callback)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, args=(app,), name='swify-reminders', daemon=True)
+                self.thread.start()
+
+    def run(self, app):
+        with app.app_context():
+            while True:
+                with self.lock:
+                    now = datetime.now()
+                    try:
+                        # Only reads: a read_only connection keeps the begin hook from taking the write lock
+                        db.session.connection(execution_options={'read_only': True})
+                        self.ensure_window(now)
+                        for user_id in list(self.stale):
+                            self.reload_user(user_id)
+                    except OperationalError:
+                        logger.exception('Loading reminders failed, retrying in %ss', RETRY_SECONDS)
+                        self.lock.wait(RETRY_SECONDS)
+                        continue
+                    finally:
+                        db.session.remove()
+                    fired = self.pop_due(now)
+                    if not fired:
+                        # Sleep until the earliest reminder or the next window slide; new work wakes us early
+                        wake_at = min([self.horizon - self.window / 2] + ([self.heap[0][0]] if self.heap else []))
+                        self.lock.wait(max((wake_at - now).total_seconds(), 0.05))
+                        continue
+                for reminder in fired:
+                    for callback in list(self.listeners):
+                        try:
+                            callback(*reminder)
+                        except Exception:
+                            logger.exception('Reminder listener failed for task %s', reminder[1])
+
+def pending_changes(session):
+    return session.info.setdefault('reminder_changes', [])
+
+@event.listens_for(Session, 'after_flush')
+def collect_task_changes(session, flush_context):
+    changes = pending_changes(session)
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Task):
+            changes.append((obj.id, obj.user_id, obj.due_date, obj.completed, obj.title, obj.seq, False, obj.recurrence is not None))
+        elif isinstance(obj, RecurrenceException) and obj.task is not None:
+            changes.append((obj.task_id, obj.task.user_id, None, None, None, None, False, True))
+    for obj in session.deleted:
+        if isinstance(obj, Task):
+            # Deletes are stamped on their tombstone, so obj.seq is stale here
+            changes.append((obj.id, obj.user_id, None, None, None, None, True, False))
+        elif isinstance(obj, RecurrenceException) and obj.task is not None and obj.task not in session.deleted:
+            changes.append((obj.task_id, obj.task.user_id, None, None, None, None, False, True))
+
+@event.listens_for(Session, 'after_commit')
+def apply_task_changes(session):
+    changes = session.info.pop('reminder_changes', None)
+    if changes and has_app_context() and 'reminders' in current_app.extensions:
+        current_app.extensions['reminders'].apply(changes)
+
+@event.listens_for(Session, 'after_rollback')
+def drop_task_changes(session):
+    session.info.pop('reminder_changes', None)
+
+def parse_within(value):
+    # '90m', '6h', '2d', or plain seconds
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    value = value.strip().lower()
+    seconds = float(value[:-1]) * units[value[-1]] if value and value[-1] in units else float(value)
+    if seconds <= 0: raise ValueError('within must be positive')
+    return timedelta(seconds=seconds)
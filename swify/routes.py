@@ -0,0 +1,627 @@
+import os
+import uuid
+import hashlib
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, current_app, jsonify, request, send_from_directory, stream_with_context
+from werkzeug.utils import secure_filename
+from .models import db, PRIORITY_RANKS, PRIORITY_ERROR, THUMBNAIL_SIZES, Task, Subtask, Attachment, RecurrenceException, Tombstone, Blob, UploadSession, StorageUsage, FocusSession, Tag, task_tags, parse_tags
+from .sync import current_seq, list_cache_key
+from .metrics import timed
+from .engine import streams_body, open_write
+from .reminders import parse_within
+from .events import stream
+from .recurrence import MAX_WINDOW, EXCEPTION_STATUSES, agenda, is_occurrence
+from .focus import PERIODS, MAX_BUCKETS, start_session, open_session, finish_session, focus_stats, parse_day
+from .serialize import LIST_FIELDS, LIST_INCLUDES, parse_list, list_columns, serialize_tasks
+from .storage import (upload_path, serve_upload, detect_file_type, copy_stream, hash_file, commit_blob, add_attachments,
+                      upload_hashers, upload_status, pillow, thumbnail_path, thumbnail_job, schedule_thumbnails)
+from .tasks import (TASK_SORT, MAX_BATCH_OPS, BatchError, encode_cursor, decode_cursor, after_cursor, stream_tasks, fts_match,
+                    search_matches, sync_tags, tag_filter, count_key, bump_count, move_count, get_counts, apply_batch_op,
+                    parse_ids, apply_subtask_patch, set_flag, apply_recurrence, parse_due_date, field_type_ok)
+
+api = Blueprint('api', __name__)
+
+@api.route('/static/uploads/<path:filename>')
+def uploaded_file(filename):
+    return serve_upload(filename)
+
+@api.route('/api/tasks', methods=['GET'])
+def get_tasks():
+    user_id = request.headers.get('X-User-ID', 'default')
+
+    cache_key, etag = list_cache_key(user_id, current_seq(user_id), request.args)
+    if etag in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    body = current_app.extensions['response_cache'].get(cache_key) if not request.args.get('stream') else None
+    if body is not None:
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response
+
+    category_filter = request.args.get('category')
+    search_query = request.args.get('q')
+
+    # Sparse fieldsets: ?fields= picks task columns (id is always sent), ?include= picks children
+    try:
+        fields = ['id'] + [f for f in parse_list(request.args['fields'], LIST_FIELDS, 'fields') if f != 'id'] if 'fields' in request.args else list(LIST_FIELDS)
+        include = parse_list(request.args['include'], LIST_INCLUDES, 'include') if 'include' in request.args else list(LIST_INCLUDES)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = Task.query.filter_by(user_id=user_id)
+    
+    if category_filter and category_filter != 'all':
+        query = query.filter_by(category=category_filter)
+    
+    # Prefer the FTS5 index; LIKE matching is the fallback when it is unavailable
+    match = fts_match(search_query) if search_query and current_app.config['SEARCH_FTS'] else None
+    if match:
+        matches = search_matches(match)
+        query = query.join(matches, matches.c.task_id == Task.id)
+    elif search_query:
+        query = query.filter(
+            Task.title.contains(search_query) | 
+            Task.description.contains(search_query) |
+            Task.tags.contains(search_query)
+        )
+        
+    # tag=a,b matches tasks carrying all listed tags (tag_mode=any for either)
+    tag_names = parse_tags(','.join(request.args.getlist('tag')))
+    if tag_names:
+        query = query.filter(tag_filter(user_id, tag_names, request.args.get('tag_mode') != 'any'))
+
+    # Keyset pagination: only return rows that sort after the cursor position
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', type=int)
+    stream = request.args.get('stream')
+    by_relevance = bool(match) and request.args.get('sort') == 'relevance'
+    if cursor and by_relevance:
+        return jsonify({'error': 'Cursors are not supported with sort=relevance'}), 400
+    if cursor:
+        try:
+            query = query.filter(after_cursor(decode_cursor(cursor)))
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    # Sort by Pinned first, then Completion status, then Priority, then Date
+    # (sort=relevance puts the bm25 rank of a search ahead of that)
+    order = [col.desc() if desc else col for col, desc in TASK_SORT]
+    if by_relevance:
+        order.insert(0, matches.c.rank)
+    query = query.order_by(*order)
+
+    # Per-user category counters, maintained by the write endpoints
+    counts = get_counts(user_id)
+
+    # Plain rows rather than ORM objects; subtasks and attachments follow in one query each
+    paginate = bool(limit and limit > 0)
+    query = query.with_entities(*list_columns(fields, paginate))
+
+    # Streamed responses keep memory flat for very large boards
+    if stream in ('ndjson', 'json'):
+        mimetype = 'application/x-ndjson' if stream == 'ndjson' else 'application/json'
+        response = Response(stream_with_context(stream_tasks(query.statement, fields, include, counts, stream == 'ndjson')), mimetype=mimetype)
+        response.set_etag(etag)
+        return response
+
+    if paginate:
+        rows = query.limit(limit + 1).all()
+        next_cursor = encode_cursor(rows[limit - 1][len(fields):]) if len(rows) > limit and not by_relevance else None
+        response = jsonify({
+            'tasks': serialize_tasks(rows[:limit], fields, include),
+            'counts': counts,
+            'next_cursor': next_cursor
+        })
+    else:
+        response = jsonify({
+            'tasks': serialize_tasks(query.all(), fields, include),
+            'counts': counts
+        })
+    current_app.extensions['response_cache'].put(cache_key, response.get_data())
+    response.set_etag(etag)
+    return response
+
+@api.route('/api/changes', methods=['GET'])
+def get_changes():
+    user_id = request.headers.get('X-User-ID', 'default')
+    since = request.args.get('since', 0, type=int)
+    # Read the sequence first: anything committed meanwhile is re-sent on the next call rather than missed
+    seq = current_seq(user_id)
+    tasks = Task.query.filter(Task.user_id == user_id, Task.seq > since).all()
+    subtasks = Subtask.query.join(Task).filter(Task.user_id == user_id, Subtask.seq > since).all()
+    attachments = Attachment.query.join(Task).filter(Task.user_id == user_id, Attachment.seq > since).all()
+    exceptions = RecurrenceException.query.join(Task).filter(Task.user_id == user_id, RecurrenceException.seq > since).all()
+    deleted = Tombstone.query.filter(Tombstone.user_id == user_id, Tombstone.seq > since).order_by(Tombstone.seq).all()
+    return jsonify({
+        'seq': seq,
+        'tasks': [task.to_dict(children=False) for task in tasks],
+        'subtasks': [subtask.to_dict() for subtask in subtasks],
+        'attachments': [attachment.to_dict() for attachment in attachments],
+        'exceptions': [exception.to_dict() for exception in exceptions],
+        'deleted': [{'entity': t.entity, 'id': t.entity_id, 'seq': t.seq} for t in deleted]
+    })
+
+# Server-Sent Events in place of polling the list: change events carry the new sequence as their id,
+# so a reconnecting EventSource sends Last-Event-ID and gets a resync if it missed anything.
+# EventSource cannot set headers, so the user may also come as ?user_id=.
+@api.route('/api/events', methods=['GET'])
+def change_events():
+    user_id = request.headers.get('X-User-ID') or request.args.get('user_id', 'default')
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    if since is not None and not since.isdigit(): return jsonify({'error': 'Invalid event id'}), 400
+    hub = current_app.extensions['events']
+    # Subscribed before the sequence is read, so nothing committed in between is missed
+    sub = hub.subscribe(current_app._get_current_object(), user_id)
+    sub.seq = current_seq(user_id)
+    # Hand the connection back now; the stream itself never touches the database
+    db.session.remove()
+    response = Response(stream_with_context(stream(hub, sub, int(since) if since is not None else None)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the client goes away, even if the body never started
+    response.call_on_close(lambda: hub.unsubscribe(sub))
+    return response
+
+@api.route('/api/reminders/upcoming', methods=['GET'])
+def upcoming_reminders():
+    user_id = request.headers.get('X-User-ID', 'default')
+    try: within = parse_within(request.args.get('within', '24h'))
+    except (ValueError, OverflowError): return jsonify({'error': 'Invalid within, use e.g. 90m, 6h, 2d or seconds'}), 400
+    if within > MAX_WINDOW: return jsonify({'error': f'within is limited to {MAX_WINDOW.days} days'}), 400
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    if limit < 1: return jsonify({'error': 'limit must be at least 1'}), 400
+    now = datetime.now()
+    reminders = current_app.extensions['reminders']
+    # Within the in-memory window the heap answers; further out is one range scan of ix_task_due
+    due = reminders.upcoming(user_id, current_seq(user_id), now, within) if within <= reminders.window else None
+    if due is not None:
+        due = due[:limit]
+    else:
+        rows = reminders.due_between(now, now + within, user_id)
+        due = sorted((due_date, task_id, title) for task_id, _, due_date, title in rows)[:limit]
+    return jsonify({
+        'now': now.isoformat(),
+        'within': within.total_seconds(),
+        'reminders': [{'id': task_id, 'title': title, 'due_date': due_date.isoformat(), 'due_in': (due_date - now).total_seconds()} for due_date, task_id, title in due]
+    })
+
+# Calendar view: what is due between start (inclusive) and end (exclusive), with repeating tasks
+# expanded into their occurrences for just this window
+@api.route('/api/agenda', methods=['GET'])
+def get_agenda():
+    user_id = request.headers.get('X-User-ID', 'default')
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    start = parse_due_date(request.args.get('start')) if request.args.get('start') else today
+    end = parse_due_date(request.args.get('end')) if request.args.get('end') else start + timedelta(days=7)
+    if start is None or end is None or end <= start: return jsonify({'error': 'Invalid start or end'}), 400
+    if end - start > MAX_WINDOW: return jsonify({'error': f'The window is limited to {MAX_WINDOW.days} days'}), 400
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'occurrences': [{'task_id': task_id, 'title': title, 'due_date': due_date.isoformat(), 'status': status, 'recurring': recurring}
+                        for due_date, task_id, title, status, recurring in agenda(start, end, user_id)]
+    })
+
+# One occurrence of a repeating task: PUT {"status": "completed" | "skipped"} records an exception for it,
+# DELETE reopens it. The occurrence is named by its due date, e.g. 2025-03-04T09:00.
+@api.route('/api/tasks/<int:id>/occurrences/<when>', methods=['PUT', 'DELETE'])
+def task_occurrence(id, when):
+    user_id = request.headers.get('X-User-ID', 'default')
+    task = Task.query.filter_by(id=id, user_id=user_id).first_or_404()
+    try: due_date = datetime.fromisoformat(when)
+    except ValueError: return jsonify({'error': 'Invalid occurrence date'}), 400
+    if not is_occurrence(task, due_date): return jsonify({'error': 'Not an occurrence of this task'}), 404
+    exception = RecurrenceException.query.filter_by(task_id=task.id, due_date=due_date).first()
+    if request.method == 'DELETE':
+        if exception is None: return jsonify({'error': 'Occurrence is not completed or skipped'}), 404
+        db.session.delete(exception)
+        db.session.commit()
+        return jsonify({'success': True})
+    status = (request.get_json(silent=True) or {}).get('status', 'completed')
+    if status not in EXCEPTION_STATUSES: return jsonify({'error': 'status must be completed or skipped'}), 400
+    if exception is None:
+        exception = RecurrenceException(task=task, due_date=due_date)
+        db.session.add(exception)
+    exception.status = status
+    db.session.commit()
+    return jsonify(exception.to_dict())
+
+@api.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(current_app.extensions['response_cache'].stats())
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(current_app.extensions['metrics'].render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/tags', methods=['GET'])
+def get_tag_facets():
+    user_id = request.headers.get('X-User-ID', 'default')
+    category_filter = request.args.get('category')
+    task_count = db.func.count(task_tags.c.task_id)
+    query = db.session.query(Tag.name, task_count).join(task_tags, task_tags.c.tag_id == Tag.id).filter(Tag.user_id == user_id)
+    if category_filter and category_filter != 'all':
+        query = query.join(Task, Task.id == task_tags.c.task_id).filter(Task.category == category_filter)
+    rows = query.group_by(Tag.id).order_by(task_count.desc(), Tag.name).all()
+    return jsonify({'tags': [{'tag': name, 'count': count} for name, count in rows]})
+
+@api.route('/api/tasks', methods=['POST'])
+def add_task():
+    user_id = request.headers.get('X-User-ID', 'default')
+    # Handle Form Data (including files)
+    title = request.form.get('title')
+    due_date_str = request.form.get('due_date')
+    category = request.form.get('category', 'Personal')
+    priority = request.form.get('priority', 'Medium')
+    description = request.form.get('description')
+    focus_time = request.form.get('focus_duration', type=int) or 25
+    color = request.form.get('color', 'default')
+    tags = request.form.get('tags', '')
+    if priority not in PRIORITY_RANKS: return jsonify({'error': PRIORITY_ERROR}), 400
+    
+    due_date = None
+    if due_date_str:
+        try:
+            if 'T' in due_date_str:
+                due_date = datetime.strptime(due_date_str, '%Y-%m-%dT%H:%M')
+            else:
+                due_date = datetime.strptime(due_date_str, '%Y-%m-%d')
+        except ValueError:
+            due_date = None
+
+    new_task = Task(
+        title=title, 
+        due_date=due_date, 
+        category=category, 
+        priority_rank=PRIORITY_RANKS[priority], 
+        description=description, 
+        focus_duration=focus_time,
+        color=color,
+        tags=tags,
+        user_id=user_id
+    )
+    try: apply_recurrence(new_task, request.form)
+    except BatchError as e: return jsonify({'error': str(e)}), e.status
+    db.session.add(new_task)
+    db.session.flush() # Get task ID
+    bump_count(user_id, count_key(new_task), 1)
+    sync_tags(new_task)
+
+    if 'attachment' in request.files:
+        add_attachments(new_task, request.files.getlist('attachment'))
+    db.session.commit()
+    return jsonify(new_task.to_dict()), 201
+
+@api.route('/api/tasks/<int:id>', methods=['PUT', 'DELETE'])
+def update_delete_task(id):
+    user_id = request.headers.get('X-User-ID', 'default')
+    task = Task.query.filter_by(id=id, user_id=user_id).first_or_404()
+    
+    if request.method == 'DELETE':
+        bump_count(user_id, count_key(task), -1)
+        db.session.delete(task)
+        db.session.commit()
+        return jsonify({'success': True})
+    
+    old_key = count_key(task)
+    if 'priority' in request.form and request.form['priority'] not in PRIORITY_RANKS: return jsonify({'error': PRIORITY_ERROR}), 400
+
+    # Update Fields
+    if 'title' in request.form: task.title = request.form.get('title')
+    if 'description' in request.form: task.description = request.form.get('description')
+    if 'category' in request.form: task.category = request.form.get('category')
+    if 'priority' in request.form: task.priority_rank = PRIORITY_RANKS[request.form['priority']]
+    if 'tags' in request.form:
+        task.tags = request.form.get('tags')
+        sync_tags(task)
+    if 'color' in request.form: task.color = request.form.get('color')
+    if 'focus_duration' in request.form: task.focus_duration = request.form.get('focus_duration', type=int)
+    
+    if 'attachment' in request.files:
+        add_attachments(task, request.files.getlist('attachment'))
+
+    if 'due_date' in request.form:
+        due_date_str = request.form.get('due_date')
+        if due_date_str:
+             try:
+                if 'T' in due_date_str:
+                    task.due_date = datetime.strptime(due_date_str, '%Y-%m-%dT%H:%M')
+                else:
+                    task.due_date = datetime.strptime(due_date_str, '%Y-%m-%d')
+             except ValueError:
+                task.due_date = None 
+        else:
+             task.due_date = None
+
+    try: apply_recurrence(task, request.form)
+    except BatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status
+
+    # Subtask edits and deletions: one query loads every subtask the form names
+    edits = {}
+    for key in request.form:
+        if key.startswith('subtask_content_'):
+            try: edits[int(key.split('_')[2])] = request.form[key]
+            except (ValueError, IndexError): pass
+    deleted_ids = parse_ids(request.form.get('deleted_subtasks'))
+    if edits or deleted_ids:
+        for sub in Subtask.query.filter(Subtask.task_id == task.id, Subtask.id.in_(edits.keys() | deleted_ids)):
+            if sub.id in deleted_ids: db.session.delete(sub)
+            else: sub.text = edits[sub.id]
+
+    deleted_attachment_ids = parse_ids(request.form.get('deleted_attachments'))
+    if deleted_attachment_ids:
+        for attach in Attachment.query.filter(Attachment.task_id == task.id, Attachment.id.in_(deleted_attachment_ids)):
+            db.session.delete(attach)
+
+    # Keep the category counters in step with a category change
+    move_count(user_id, old_key, count_key(task))
+    db.session.commit()
+    return jsonify(task.to_dict())
+
+@api.route('/api/tasks/batch', methods=['POST'])
+def batch_tasks():
+    user_id = request.headers.get('X-User-ID', 'default')
+    ops = (request.get_json(silent=True) or {}).get('ops')
+    if not isinstance(ops, list) or not ops: return jsonify({'error': 'No ops provided'}), 400
+    if len(ops) > MAX_BATCH_OPS: return jsonify({'error': f'At most {MAX_BATCH_OPS} ops per batch'}), 400
+    if not all(isinstance(op, dict) for op in ops): return jsonify({'error': 'Malformed op'}), 400
+    # Load every referenced task and subtask up front: two queries for the whole batch
+    task_ids = {op.get('id') for op in ops if isinstance(op.get('id'), int)}
+    subtask_ids = {sub.get('id') for op in ops for sub in (op.get('subtasks') or []) if isinstance(sub, dict) and isinstance(sub.get('id'), int)}
+    tasks = {task.id: task for task in Task.query.filter(Task.user_id == user_id, Task.id.in_(task_ids))} if task_ids else {}
+    subtasks = {sub.id: sub for sub in Subtask.query.join(Task).filter(Task.user_id == user_id, Subtask.id.in_(subtask_ids))} if subtask_ids else {}
+    applied, refs = [], {}
+    try:
+        for index, op in enumerate(ops):
+            try: applied.append(apply_batch_op(user_id, op, tasks, subtasks, refs))
+            except (KeyError, TypeError, AttributeError): raise BatchError('Malformed op')
+    except BatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'index': index}), e.status
+    db.session.flush()
+    results = []
+    for result, task, subtask_results in applied:
+        if task is not None: result['id'] = task.id
+        if subtask_results: result['subtasks'] = [dict(sub_result, id=sub.id) if sub is not None else sub_result for sub_result, sub in subtask_results]
+        results.append(result)
+    db.session.commit()
+    return jsonify({'results': results})
+
+@api.route('/api/tasks/<int:id>/subtasks', methods=['PATCH'])
+def patch_subtasks(id):
+    user_id = request.headers.get('X-User-ID', 'default')
+    task = Task.query.filter_by(id=id, user_id=user_id).first_or_404()
+    patch = request.get_json(silent=True)
+    if not isinstance(patch, dict) or not patch: return jsonify({'error': 'No changes provided'}), 400
+    try: result = apply_subtask_patch(task, patch)
+    except BatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status
+    # Serialized before the commit expires them, so the response costs this one query
+    result['subtasks'] = [sub.to_dict() for sub in Subtask.query.filter_by(task_id=task.id).order_by(Subtask.position)]
+    db.session.commit()
+    return jsonify(result)
+
+@api.route('/api/tasks/<int:id>/toggle-pin', methods=['POST'])
+def toggle_pin(id):
+    user_id = request.headers.get('X-User-ID', 'default')
+    if set_flag(Task, id, user_id, 'is_pinned') is None: return jsonify({'error': 'Task not found'}), 404
+    db.session.commit()
+    return jsonify(db.session.get(Task, id).to_dict())
+
+@api.route('/api/tasks/<int:id>/complete', methods=['POST'])
+def complete_task(id):
+    user_id = request.headers.get('X-User-ID', 'default')
+    if set_flag(Task, id, user_id, 'completed') is None: return jsonify({'error': 'Task not found'}), 404
+    db.session.commit()
+    return jsonify(db.session.get(Task, id).to_dict())
+
+# Minimal flag endpoints: PUT {"value": bool} sets, POST .../toggle flips.
+# The response is just the flag and the new version, for clients that keep their own copy of the row.
+@api.route('/api/tasks/<int:id>/<any(completed, is_pinned):field>', methods=['PUT'])
+@api.route('/api/tasks/<int:id>/<any(completed, is_pinned):field>/toggle', methods=['POST'])
+def task_flag(id, field):
+    return flag_response(Task, id, field)
+
+@api.route('/api/subtasks/<int:id>/<any(completed):field>', methods=['PUT'])
+@api.route('/api/subtasks/<int:id>/<any(completed):field>/toggle', methods=['POST'])
+def subtask_flag(id, field):
+    return flag_response(Subtask, id, field)
+
+def flag_response(model, id, field):
+    user_id = request.headers.get('X-User-ID', 'default')
+    value = None
+    if request.method == 'PUT':
+        value = (request.get_json(silent=True) or {}).get('value')
+        if not isinstance(value, bool): return jsonify({'error': 'value must be true or false'}), 400
+    result = set_flag(model, id, user_id, field, value)
+    if result is None: return jsonify({'error': f'{model.__name__} not found'}), 404
+    db.session.commit()
+    return jsonify(result)
+
+@api.route('/api/tasks/<int:task_id>/subtasks', methods=['POST'])
+def add_subtask(task_id):
+    user_id = request.headers.get('X-User-ID', 'default')
+    task = Task.query.filter_by(id=task_id, user_id=user_id).first_or_404()
+    data = request.json or request.form
+    text = data.get('text')
+    if text:
+        subtask = Subtask(text=text, task_id=task.id)
+        db.session.add(subtask)
+        db.session.commit()
+        return jsonify(subtask.to_dict())
+    return jsonify({'error': 'No text provided'}), 400
+
+@api.route('/api/subtasks/<int:id>/toggle', methods=['POST'])
+def toggle_subtask(id):
+    user_id = request.headers.get('X-User-ID', 'default')
+    if set_flag(Subtask, id, user_id, 'completed') is None:
+        Subtask.query.get_or_404(id)
+        return jsonify({'error': 'Unauthorized'}), 403
+    db.session.commit()
+    return jsonify(db.session.get(Subtask, id).to_dict())
+
+@api.route('/api/subtasks/<int:id>', methods=['DELETE'])
+def delete_subtask(id):
+    user_id = request.headers.get('X-User-ID', 'default')
+    subtask = Subtask.query.get_or_404(id)
+    if subtask.task.user_id != user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    db.session.delete(subtask)
+    db.session.commit()
+    return jsonify({'success': True})
+
+@api.route('/api/uploads', methods=['POST'])
+def create_upload():
+    user_id = request.headers.get('X-User-ID', 'default')
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    size = data.get('size')
+    if not filename: return jsonify({'error': 'No filename provided'}), 400
+    if size is not None and (not isinstance(size, int) or size < 0): return jsonify({'error': 'Invalid size'}), 400
+    if size is not None and size > current_app.config['MAX_UPLOAD_BYTES']: return jsonify({'error': 'File too large'}), 413
+    upload = UploadSession(id=uuid.uuid4().hex, user_id=user_id, filename=filename, size=size)
+    os.makedirs(upload_path('partial'), exist_ok=True)
+    open(upload_path('partial', f'{upload.id}.part'), 'wb').close()
+    upload_hashers[upload.id] = (0, hashlib.sha256())
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify(upload_status(upload)), 201
+
+@api.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    user_id = request.headers.get('X-User-ID', 'default')
+    upload = UploadSession.query.filter_by(id=upload_id, user_id=user_id).first_or_404()
+    return jsonify(upload_status(upload))
+
+@api.route('/api/uploads/<upload_id>', methods=['PATCH'])
+@streams_body
+def append_upload(upload_id):
+    user_id = request.headers.get('X-User-ID', 'default')
+    upload = UploadSession.query.filter_by(id=upload_id, user_id=user_id).first_or_404()
+    part_path = upload_path('partial', f'{upload.id}.part')
+    offset = os.path.getsize(part_path)
+    # The client states where its chunk starts; a mismatch means it should resume from our offset
+    if request.headers.get('Upload-Offset', type=int) != offset: return jsonify({'error': 'Offset mismatch', 'offset': offset}), 409
+    limit = (upload.size if upload.size is not None else current_app.config['MAX_UPLOAD_BYTES']) - offset
+    hashed, hasher = upload_hashers.pop(upload.id, (None, None))
+    if hashed != offset: hasher = None
+    # No transaction stays open while the chunk trickles in
+    db.session.commit()
+    with open(part_path, 'ab') as dst:
+        try: written = copy_stream(request.stream, dst, hasher, limit)
+        except ValueError:
+            dst.truncate(offset)
+            return jsonify({'error': 'File too large', 'offset': offset}), 413
+    if hasher is not None: upload_hashers[upload.id] = (offset + written, hasher)
+    return jsonify(upload_status(upload))
+
+@api.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@streams_body
+def complete_upload(upload_id):
+    user_id = request.headers.get('X-User-ID', 'default')
+    upload = UploadSession.query.filter_by(id=upload_id, user_id=user_id).first_or_404()
+    task_id = (request.get_json(silent=True) or {}).get('task_id')
+    if task_id is not None: Task.query.filter_by(id=task_id, user_id=user_id).first_or_404()
+    part_path = upload_path('partial', f'{upload.id}.part')
+    size = os.path.getsize(part_path)
+    if upload.size is not None and size != upload.size: return jsonify({'error': 'Upload incomplete', 'offset': size}), 409
+    # Hashing a large file (when another process received the chunks) happens before the write lock is taken
+    db.session.commit()
+    hashed, hasher = upload_hashers.pop(upload_id, (None, None))
+    try: sha256 = hasher.hexdigest() if hashed == size else hash_file(part_path)
+    except FileNotFoundError: return jsonify({'error': 'Upload not found'}), 404
+    busy = open_write()
+    if busy is not None: return busy
+    # Looked up again under the lock: a concurrent complete or delete may have won the race
+    upload = UploadSession.query.filter_by(id=upload_id, user_id=user_id).first_or_404()
+    task = Task.query.filter_by(id=task_id, user_id=user_id).first_or_404() if task_id is not None else None
+    blob = commit_blob(part_path, sha256, size, upload.filename)
+    db.session.delete(upload)
+    result = {'sha256': blob.sha256, 'size': blob.size, 'file_path': f"uploads/{blob.path}"}
+    if task is not None:
+        attachment = Attachment(file_path=result['file_path'], file_type=detect_file_type(upload.filename), blob_sha256=blob.sha256, task_id=task.id)
+        db.session.add(attachment)
+        schedule_thumbnails(blob, attachment.file_type)
+        db.session.flush()
+        result['attachment'] = attachment.to_dict()
+    db.session.commit()
+    return jsonify(result), 201
+
+@api.route('/api/thumbnails/<sha256>/<int:size>', methods=['GET'])
+def get_thumbnail(sha256, size):
+    blob = db.session.get(Blob, sha256)
+    if blob is None or size not in THUMBNAIL_SIZES: return jsonify({'error': 'Not found'}), 404
+    path = thumbnail_path(sha256, size)
+    if not os.path.exists(upload_path(path)):
+        # Never built, still queued, or cleaned up: build it now, or fall back to the original
+        with timed('file'):
+            built = pillow() is not None and thumbnail_job(sha256, blob.path, size).result() is not None
+        if not built:
+            return send_from_directory(current_app.config['UPLOAD_FOLDER'], blob.path)
+    return serve_upload(path)
+
+@api.route('/api/storage/usage', methods=['GET'])
+def get_storage_usage():
+    user_id = request.headers.get('X-User-ID', 'default')
+    usage = db.session.get(StorageUsage, user_id)
+    return jsonify({'bytes': usage.bytes if usage else 0, 'files': usage.files if usage else 0})
+
+# Focus sessions: POST starts one (optionally for a task, whose category and tags it records), finish
+# closes it and folds it into the day and week rollups that /api/analytics/focus reads
+@api.route('/api/focus/sessions', methods=['POST'])
+def start_focus_session():
+    user_id = request.headers.get('X-User-ID', 'default')
+    data = request.get_json(silent=True) or {}
+    planned = data.get('planned_minutes')
+    if planned is not None and (not isinstance(planned, int) or isinstance(planned, bool) or planned <= 0):
+        return jsonify({'error': 'planned_minutes must be a positive integer'}), 400
+    if data.get('task_id') is not None and type(data['task_id']) is not int: return jsonify({'error': 'task_id must be an integer'}), 400
+    for field in ('category', 'tags'):
+        if not field_type_ok(field, data.get(field)): return jsonify({'error': f'{field} must be a string'}), 400
+    try: session = start_session(user_id, data)
+    except LookupError as e: return jsonify({'error': str(e)}), 404
+    if session is None:
+        return jsonify({'error': 'A focus session is already open', 'session': open_session(user_id).to_dict()}), 409
+    db.session.commit()
+    return jsonify(session.to_dict()), 201
+
+@api.route('/api/focus/sessions/open', methods=['GET'])
+def get_open_focus_session():
+    user_id = request.headers.get('X-User-ID', 'default')
+    session = open_session(user_id)
+    return jsonify(session.to_dict() if session else None)
+
+@api.route('/api/focus/sessions/<int:id>/finish', methods=['POST'])
+def finish_focus_session(id):
+    user_id = request.headers.get('X-User-ID', 'default')
+    data = request.get_json(silent=True) or {}
+    seconds = data.get('seconds')
+    if seconds is not None and (not isinstance(seconds, int) or isinstance(seconds, bool) or seconds < 0):
+        return jsonify({'error': 'seconds must be a non-negative integer'}), 400
+    session = finish_session(id, user_id, bool(data.get('completed', True)), seconds)
+    if session is None:
+        if FocusSession.query.filter_by(id=id, user_id=user_id).first() is None: return jsonify({'error': 'Focus session not found'}), 404
+        return jsonify({'error': 'Focus session already finished'}), 409
+    db.session.commit()
+    return jsonify(session.to_dict())
+
+# Focus time per day or week between start and end (inclusive dates), broken down by category or tag.
+# Reads only the rollups: one row per bucket and group, however many sessions they hold.
+@api.route('/api/analytics/focus', methods=['GET'])
+def focus_analytics():
+    user_id = request.headers.get('X-User-ID', 'default')
+    period, by = request.args.get('period', 'day'), request.args.get('by', 'category')
+    if period not in PERIODS: return jsonify({'error': 'period must be day or week'}), 400
+    if by not in ('category', 'tag'): return jsonify({'error': 'by must be category or tag'}), 400
+    end_default = datetime.now().date()
+    try:
+        end = parse_day(request.args.get('end'), end_default)
+        start = parse_day(request.args.get('start'), end - timedelta(days=6 if period == 'day' else 7 * 7))
+    except ValueError: return jsonify({'error': 'Invalid start or end, use YYYY-MM-DD'}), 400
+    if end < start: return jsonify({'error': 'end is before start'}), 400
+    if (end - start).days // (7 if period == 'week' else 1) >= MAX_BUCKETS:
+        return jsonify({'error': f'At most {MAX_BUCKETS} {period}s per request'}), 400
+    buckets, totals = focus_stats(user_id, period, start, end, by)
+    return jsonify({'period': period, 'by': by, 'start': start.isoformat(), 'end': end.isoformat(), 'buckets': buckets, 'totals': totals})
@@ -0,0 +1,150 @@
+from .models import db, parse_tags
+
+# Full-text index over task text and subtask text, kept in sync by triggers
+# (the subtask triggers gather siblings through ix_subtask_task_id)
+FTS_SCHEMA = [
+    "CREATE INDEX IF NOT EXISTS ix_subtask_task_id ON subtask (task_id)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5(title, description, tags, subtasks, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_ai AFTER INSERT ON task BEGIN INSERT INTO task_fts (rowid, title, description, tags, subtasks) VALUES (new.id, new.title, new.description, new.tags, ''); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_au AFTER UPDATE OF title, description, tags ON task BEGIN UPDATE task_fts SET title = new.title, description = new.description, tags = new.tags WHERE rowid = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_ad AFTER DELETE ON task BEGIN DELETE FROM task_fts WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS subtask_fts_ai AFTER INSERT ON subtask BEGIN UPDATE task_fts SET subtasks = (SELECT group_concat(text, ' ') FROM subtask WHERE task_id = new.task_id) WHERE rowid = new.task_id; END",
+    "CREATE TRIGGER IF NOT EXISTS subtask_fts_au AFTER UPDATE OF text ON subtask BEGIN UPDATE task_fts SET subtasks = (SELECT group_concat(text, ' ') FROM subtask WHERE task_id = new.task_id) WHERE rowid = new.task_id; END",
+    "CREATE TRIGGER IF NOT EXISTS subtask_fts_ad AFTER DELETE ON subtask BEGIN UPDATE task_fts SET subtasks = (SELECT group_concat(text, ' ') FROM subtask WHERE task_id = old.task_id) WHERE rowid = old.task_id; END",
+]
+FTS_BACKFILL = "INSERT INTO task_fts (rowid, title, description, tags, subtasks) SELECT id, title, description, tags, (SELECT group_concat(text, ' ') FROM subtask WHERE task_id = task.id) FROM task"
+# bm25 column weights for title, description, tags, subtasks
+FTS_WEIGHTS = (10.0, 1.0, 5.0, 2.0)
+
+# Schema migrations, applied in order and tracked in SQLite's user_version.
+# A fresh database gets the current schema from create_all before they run,
+# so each step checks for its change instead of assuming it is missing.
+MIGRATIONS = []
+SCHEMA_STATE = "SELECT user_version, EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'task_fts') FROM pragma_user_version"
+
+def migration(step):
+    MIGRATIONS.append(step)
+    return step
+
+def has_column(conn, table, column):
+    return any(row[1] == column for row in conn.exec_driver_sql(f'PRAGMA table_info({table})'))
+
+def add_column(conn, table, column, ddl):
+    if not has_column(conn, table, column):
+        conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+
+def create_indexes(conn, *names):
+    # By name, so an early step never builds an index on a column a later step adds
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(conn, checkfirst=True)
+
+@migration
+def add_task_owner_columns(conn):
+    add_column(conn, 'task', 'tags', 'VARCHAR(200)')
+    add_column(conn, 'task', 'user_id', 'VARCHAR(50)')
+
+@migration
+def backfill_task_counts(conn):
+    conn.exec_driver_sql("INSERT OR REPLACE INTO task_count (user_id, category, completed, count) SELECT user_id, coalesce(category, ''), coalesce(completed, 0), count(*) FROM task WHERE user_id IS NOT NULL GROUP BY 1, 2, 3")
+
+@migration
+def add_search_index(conn):
+    # SQLite built without FTS5: search keeps using LIKE matching
+    if not conn.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar(): return
+    for statement in FTS_SCHEMA:
+        conn.exec_driver_sql(statement)
+    conn.exec_driver_sql("DELETE FROM task_fts")
+    conn.exec_driver_sql(FTS_BACKFILL)
+
+@migration
+def add_priority_rank(conn):
+    add_column(conn, 'task', 'priority_rank', 'INTEGER')
+    if has_column(conn, 'task', 'priority'):
+        # Anything but the three names the API accepts reads back as Medium
+        conn.exec_driver_sql("UPDATE task SET priority_rank = CASE priority WHEN 'High' THEN 1 WHEN 'Medium' THEN 2 WHEN 'Low' THEN 3 ELSE 2 END WHERE priority_rank IS NULL")
+
+@migration
+def add_board_indexes(conn):
+    create_indexes(conn, 'ix_task_board', 'ix_task_board_category', 'ix_subtask_task_id', 'ix_attachment_task_id')
+
+@migration
+def backfill_tags(conn):
+    # One streaming pass over task.tags; tag ids are cached so each tag is looked up once
+    tag_ids, links = {}, []
+    for task_id, user_id, tags in conn.exec_driver_sql("SELECT id, user_id, tags FROM task WHERE user_id IS NOT NULL AND tags IS NOT NULL AND tags != ''"):
+        for name in parse_tags(tags):
+            if (user_id, name) not in tag_ids:
+                conn.exec_driver_sql("INSERT OR IGNORE INTO tag (user_id, name) VALUES (?, ?)", (user_id, name))
+                tag_ids[(user_id, name)] = conn.exec_driver_sql("SELECT id FROM tag WHERE user_id = ? AND name = ?", (user_id, name)).scalar()
+            links.append((task_id, tag_ids[(user_id, name)]))
+        if len(links) >= 500:
+            conn.exec_driver_sql("INSERT OR IGNORE INTO task_tag (task_id, tag_id) VALUES (?, ?)", links)
+            links = []
+    if links:
+        conn.exec_driver_sql("INSERT OR IGNORE INTO task_tag (task_id, tag_id) VALUES (?, ?)", links)
+
+@migration
+def add_change_sequence(conn):
+    for table in ('task', 'subtask', 'attachment'):
+        add_column(conn, table, 'seq', 'INTEGER DEFAULT 0')
+    # Rows that predate change tracking count as their owner's first change
+    for table in ('task', 'subtask', 'attachment'):
+        conn.exec_driver_sql(f"UPDATE {table} SET seq = 1 WHERE seq IS NULL OR seq = 0")
+    conn.exec_driver_sql("INSERT OR IGNORE INTO user_sequence (user_id, seq) SELECT DISTINCT user_id, 1 FROM task WHERE user_id IS NOT NULL")
+    create_indexes(conn, 'ix_task_user_seq', 'ix_subtask_seq', 'ix_attachment_seq')
+
+@migration
+def add_blob_storage(conn):
+    add_column(conn, 'attachment', 'blob_sha256', 'VARCHAR(64)')
+    create_indexes(conn, 'ix_attachment_blob_sha256')
+
+@migration
+def backfill_storage_usage(conn):
+    conn.exec_driver_sql("INSERT OR REPLACE INTO storage_usage (user_id, bytes, files) SELECT task.user_id, sum(blob.size), count(*) FROM attachment JOIN task ON task.id = attachment.task_id JOIN blob ON blob.sha256 = attachment.blob_sha256 WHERE task.user_id IS NOT NULL GROUP BY 1")
+
+@migration
+def add_subtask_position(conn):
+    add_column(conn, 'subtask', 'position', 'INTEGER')
+    # Existing checklists keep their insertion order
+    conn.exec_driver_sql("UPDATE subtask SET position = id WHERE position IS NULL")
+    create_indexes(conn, 'ix_subtask_task_position')
+
+@migration
+def add_due_index(conn):
+    create_indexes(conn, 'ix_task_due')
+
+@migration
+def add_notifications(conn):
+    # The table itself comes from create_all
+    create_indexes(conn, 'ix_notification_created_at')
+
+@migration
+def add_recurrence(conn):
+    add_column(conn, 'task', 'recurrence', 'VARCHAR(20)')
+    add_column(conn, 'task', 'recurrence_interval', 'INTEGER')
+    add_column(conn, 'task', 'recurrence_end', 'DATETIME')
+    create_indexes(conn, 'ix_task_recurring')
+
+@migration
+def add_focus_sessions(conn):
+    # The tables come from create_all
+    create_indexes(conn, 'ix_focus_session_user_started', 'uq_focus_session_open')
+
+@migration
+def normalize_priority_ranks(conn):
+    # Earlier versions stored unknown priorities as rank 4, which has no name and serialized as null
+    conn.exec_driver_sql("UPDATE task SET priority_rank = 2 WHERE priority_rank IS NULL OR priority_rank NOT IN (1, 2, 3)")
+
+def migrate_database():
+    # A current database costs one query: its version and whether FTS5 search is available.
+    # create_all and the migration steps only run when the version is behind.
+    with db.engine.begin() as conn:
+        version, has_fts = conn.exec_driver_sql(SCHEMA_STATE).one()
+        if version >= len(MIGRATIONS):
+            return bool(has_fts)
+        db.metadata.create_all(conn)
+        for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            step(conn)
+            conn.exec_driver_sql(f'PRAGMA user_version = {number}')
+        return bool(conn.exec_driver_sql(SCHEMA_STATE).one()[1])
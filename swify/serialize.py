@@ -0,0 +1,105 @@
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import String, type_coerce
+from .metrics import timed, add_json_bytes
+from .models import db, PRIORITY_NAMES, Task, Subtask, Attachment, thumbnail_urls
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is used instead
+    orjson = None
+
+class FastJSONProvider(DefaultJSONProvider):
+    # orjson when it is installed. Datetimes and other non-JSON types still go through
+    # DefaultJSONProvider.default, so responses look the same with either encoder.
+    def options(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        return options | orjson.OPT_SORT_KEYS if self.sort_keys else options
+
+    def dumps(self, obj, **kwargs):
+        with timed('json'):
+            if orjson is None or kwargs:
+                body = super().dumps(obj, **kwargs)
+            else:
+                body = orjson.dumps(obj, default=self.default, option=self.options()).decode()
+        add_json_bytes(len(body))
+        return body
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        with timed('json'):
+            body = orjson.dumps(obj, default=self.default, option=self.options() | orjson.OPT_APPEND_NEWLINE)
+        add_json_bytes(len(body))
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+# Task list read path: Core rows instead of ORM instances, limited to the fields a client asks for
+# (?fields=id,title,color,is_pinned) and the children it wants (?include=subtasks,attachments).
+# Datetimes are read as their stored text, which is already ISO 8601 apart from the separator.
+task, subtask, attachment = Task.__table__, Subtask.__table__, Attachment.__table__
+LIST_FIELDS = {
+    'id': task.c.id,
+    'title': task.c.title,
+    'description': task.c.description,
+    'category': task.c.category,
+    'priority': task.c.priority_rank,
+    'completed': task.c.completed,
+    'due_date': type_coerce(task.c.due_date, String),
+    'focus_duration': task.c.focus_duration,
+    'created_at': type_coerce(task.c.created_at, String),
+    'color': task.c.color,
+    'is_pinned': task.c.is_pinned,
+    'tags': task.c.tags,
+    'recurrence': task.c.recurrence,
+    'recurrence_interval': task.c.recurrence_interval,
+    'recurrence_end': type_coerce(task.c.recurrence_end, String),
+    'seq': task.c.seq,
+}
+LIST_INCLUDES = ('subtasks', 'attachments')
+# Raw values of TASK_SORT for keyset cursors, selected after the requested fields when paginating
+SORT_KEY = [task.c.is_pinned, task.c.completed, task.c.priority_rank, type_coerce(task.c.due_date, String), type_coerce(task.c.created_at, String), task.c.id]
+CHILD_CHUNK = 500
+
+def iso(value):
+    # '2024-05-01 09:30:00.000000' as stored, to what datetime.isoformat() gives for the same value
+    if value is None: return None
+    value = value.replace(' ', 'T', 1)
+    return value[:-7] if value.endswith('.000000') else value
+
+CONVERTERS = {'priority': PRIORITY_NAMES.get, 'due_date': iso, 'created_at': iso, 'recurrence_end': iso}
+
+def parse_list(value, allowed, name):
+    names = [n.strip() for n in value.split(',') if n.strip()]
+    unknown = [n for n in names if n not in allowed]
+    if unknown: raise ValueError(f'Unknown {name}: {", ".join(unknown)}')
+    return names
+
+def list_columns(fields, paginate):
+    columns = [LIST_FIELDS[name] for name in fields]
+    return columns + SORT_KEY if paginate else columns
+
+def serialize_tasks(rows, fields, include):
+    # rows come from list_columns(fields, ...); 'id' is always among fields
+    convert = [(i, name, CONVERTERS.get(name)) for i, name in enumerate(fields)]
+    tasks = [{name: (fn(row[i]) if fn else row[i]) for i, name, fn in convert} for row in rows]
+    if include and tasks:
+        by_id = {}
+        for data in tasks:
+            by_id[data['id']] = data
+            for kind in include: data[kind] = []
+        ids = list(by_id)
+        for start in range(0, len(ids), CHILD_CHUNK):
+            chunk = ids[start:start + CHILD_CHUNK]
+            if 'subtasks' in include:
+                for row in db.session.execute(db.select(subtask.c.id, subtask.c.text, subtask.c.completed, subtask.c.task_id, subtask.c.position, subtask.c.seq)
+                                              .where(subtask.c.task_id.in_(chunk)).order_by(subtask.c.task_id, subtask.c.position)):
+                    by_id[row.task_id]['subtasks'].append(dict(row._mapping))
+            if 'attachments' in include:
+                for row in db.session.execute(db.select(attachment.c.id, attachment.c.file_path, attachment.c.file_type, attachment.c.blob_sha256, attachment.c.task_id, attachment.c.seq)
+                                              .where(attachment.c.task_id.in_(chunk)).order_by(attachment.c.id)):
+                    by_id[row.task_id]['attachments'].append({
+                        'id': row.id, 'file_path': row.file_path, 'file_type': row.file_type, 'sha256': row.blob_sha256,
+                        'thumbnails': thumbnail_urls(row.blob_sha256, row.file_type),
+                        'task_id': row.task_id, 'seq': row.seq,
+                    })
+    return tasks
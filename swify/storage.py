@@ -0,0 +1,313 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import mimetypes
+import threading
+import functools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import click
+from flask import Response, current_app, jsonify, send_from_directory
+from flask.cli import with_appcontext
+from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from sqlalchemy import bindparam, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from .models import db, THUMBNAIL_SIZES, Attachment, Blob, UploadSession, StorageUsage
+from .sync import change_owner
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed attachment storage: bytes live once under blobs/<sha[:2]>/<sha><ext>,
+# shared by every Attachment row that references them
+COPY_BUFFER = 64 * 1024
+UPLOAD_MAX_AGE = 365 * 24 * 3600
+
+def upload_path(*parts):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], *parts)
+
+def serve_upload(path):
+    # Upload names are never reused (content hashes or timestamped), so clients may cache them for good.
+    # Content-addressed files use their hash as a strong ETag; werkzeug answers Range/If-Range with 206s.
+    name = os.path.splitext(os.path.basename(path))[0]
+    etag = name if path.startswith(('blobs/', 'thumbs/')) else True
+    if current_app.config['UPLOAD_OFFLOAD'] == 'x-accel':
+        # nginx serves the bytes (ranges included) from an internal location; we only answer with headers
+        if safe_join(current_app.config['UPLOAD_FOLDER'], path) is None or not os.path.isfile(upload_path(path)):
+            return jsonify({'error': 'Not found'}), 404
+        response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = current_app.config['UPLOAD_ACCEL_PREFIX'] + path
+        if etag is not True:
+            response.set_etag(etag)
+    else:
+        response = send_from_directory(current_app.config['UPLOAD_FOLDER'], path, etag=etag, max_age=UPLOAD_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.max_age = UPLOAD_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+def detect_file_type(filename):
+    ext = filename.split('.')[-1].lower()
+    return 'image' if ext in ['jpg', 'jpeg', 'png', 'gif', 'webp'] else 'video' if ext in ['mp4', 'webm', 'ogg', 'mov'] else 'audio' if ext in ['mp3', 'wav', 'mpeg', 'm4a'] else 'file'
+
+def copy_stream(src, dst, hasher=None, limit=None):
+    # Streams src into dst in fixed-size blocks, hashing as it writes; never holds the whole file
+    size = 0
+    with timed('file'):
+        while True:
+            chunk = src.read(COPY_BUFFER)
+            if not chunk:
+                return size
+            size += len(chunk)
+            if limit is not None and size > limit:
+                raise ValueError('Upload exceeds size limit')
+            dst.write(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with timed('file'), open(path, 'rb') as src:
+        for chunk in iter(lambda: src.read(COPY_BUFFER), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def commit_blob(part_path, sha256, size, filename):
+    blob = db.session.get(Blob, sha256)
+    if blob is not None and os.path.exists(upload_path(blob.path)):
+        os.remove(part_path)
+        os.utime(upload_path(blob.path))
+        return blob
+    path = blob.path if blob is not None else f"blobs/{sha256[:2]}/{sha256}{os.path.splitext(filename)[1].lower()[:10]}"
+    os.makedirs(os.path.dirname(upload_path(path)), exist_ok=True)
+    os.replace(part_path, upload_path(path))
+    if blob is None:
+        db.session.execute(sqlite_insert(Blob).values(sha256=sha256, size=size, path=path, ref_count=0).on_conflict_do_nothing())
+        blob = db.session.get(Blob, sha256)
+    return blob
+
+def store_upload(stream, filename):
+    os.makedirs(upload_path('partial'), exist_ok=True)
+    hasher = hashlib.sha256()
+    fd, part_path = tempfile.mkstemp(dir=upload_path('partial'), suffix='.part')
+    with os.fdopen(fd, 'wb') as dst:
+        size = copy_stream(stream, dst, hasher)
+    return commit_blob(part_path, hasher.hexdigest(), size, filename)
+
+# Image derivatives: downscaled copies under thumbs/<sha[:2]>/<sha>-<size>.<format>, keyed by content hash
+# so duplicate uploads share them. Built by a bounded worker pool after upload, or on first request if missing.
+thumbnail_pool = None
+thumbnail_jobs = {}
+thumbnail_lock = threading.Lock()
+
+@functools.cache
+def pillow():
+    # Imported on first use rather than at startup; Pillow is optional and without it images are served at full size
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    return Image, ImageOps
+
+def thumbnail_path(sha256, size):
+    return f"thumbs/{sha256[:2]}/{sha256}-{size}.{current_app.config['THUMBNAIL_FORMAT']}"
+
+def render_thumbnail(source, dest, size, fmt):
+    # Runs on a pool thread, outside the app context
+    if os.path.exists(dest):
+        return dest
+    Image, ImageOps = pillow()
+    try:
+        with Image.open(source) as img:
+            img.draft('RGB', (size, size))  # JPEGs decode straight at a reduced scale
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((size, size))
+            alpha = fmt != 'jpeg' and ('A' in img.getbands() or 'transparency' in img.info)
+            img = img.convert('RGBA' if alpha else 'RGB')
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            fd, part_path = tempfile.mkstemp(dir=os.path.dirname(dest), suffix='.part')
+            with os.fdopen(fd, 'wb') as dst:
+                img.save(dst, fmt, quality=80)
+            os.replace(part_path, dest)
+        return dest
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning('Could not build %dpx thumbnail for %s', size, source)
+        return None
+
+def thumbnail_job(sha256, path, size):
+    # One job per (blob, size); a request arriving mid-build waits on the same future
+    global thumbnail_pool
+    key = (sha256, size)
+    with thumbnail_lock:
+        if thumbnail_pool is None:
+            thumbnail_pool = ThreadPoolExecutor(max_workers=current_app.config['THUMBNAIL_WORKERS'], thread_name_prefix='thumbnail')
+        future = thumbnail_jobs.get(key)
+        if future is None:
+            future = thumbnail_jobs[key] = thumbnail_pool.submit(render_thumbnail, upload_path(path), upload_path(thumbnail_path(sha256, size)), size, current_app.config['THUMBNAIL_FORMAT'])
+            future.add_done_callback(lambda _: thumbnail_jobs.pop(key, None))
+    return future
+
+def schedule_thumbnails(blob, file_type):
+    if file_type != 'image' or pillow() is None:
+        return
+    for size in THUMBNAIL_SIZES:
+        if not os.path.exists(upload_path(thumbnail_path(blob.sha256, size))):
+            thumbnail_job(blob.sha256, blob.path, size)
+
+def add_attachments(task, files):
+    for file in files:
+        if file and file.filename != '':
+            filename = secure_filename(file.filename)
+            blob = store_upload(file.stream, filename)
+            file_type = detect_file_type(filename)
+            db.session.add(Attachment(file_path=f"uploads/{blob.path}", file_type=file_type, blob_sha256=blob.sha256, task_id=task.id))
+            schedule_thumbnails(blob, file_type)
+
+@event.listens_for(Session, 'before_flush')
+def count_blob_refs(session, flush_context, instances):
+    # Blob.ref_count and the owner's StorageUsage move with every attachment row added or removed
+    attached = [(obj, 1) for obj in session.new if isinstance(obj, Attachment) and obj.blob_sha256]
+    attached += [(obj, -1) for obj in session.deleted if isinstance(obj, Attachment) and obj.blob_sha256]
+    if not attached:
+        return
+    refs, used_bytes, used_files = Counter(), Counter(), Counter()
+    with session.no_autoflush:
+        sizes = dict(session.execute(db.select(Blob.sha256, Blob.size).where(Blob.sha256.in_({obj.blob_sha256 for obj, _ in attached}))).all())
+        for obj, delta in attached:
+            refs[obj.blob_sha256] += delta
+            owner = change_owner(session, obj)
+            if owner is None:
+                continue
+            used_bytes[owner] += delta * sizes.get(obj.blob_sha256, 0)
+            used_files[owner] += delta
+    apply_blob_deltas(session, refs, used_bytes, used_files)
+
+def apply_blob_deltas(session, refs, used_bytes, used_files):
+    # Also called directly by set-based attachment deletes, which bypass the flush hook above
+    blob = Blob.__table__
+    deltas = [{'b_sha256': sha256, 'b_delta': delta} for sha256, delta in refs.items() if delta]
+    if deltas:
+        session.execute(blob.update().where(blob.c.sha256 == bindparam('b_sha256')).values(ref_count=blob.c.ref_count + bindparam('b_delta')), deltas)
+    for user_id, files in used_files.items():
+        stmt = sqlite_insert(StorageUsage).values(user_id=user_id, bytes=used_bytes[user_id], files=files)
+        session.execute(stmt.on_conflict_do_update(index_elements=['user_id'], set_={'bytes': StorageUsage.bytes + used_bytes[user_id], 'files': StorageUsage.files + files}))
+
+# Hash state of in-flight resumable uploads, keyed by upload id: (bytes hashed, hasher).
+# Process-local; a chunk landing on another worker just means the file is re-hashed on completion.
+upload_hashers = {}
+
+def upload_status(upload):
+    return {'upload_id': upload.id, 'filename': upload.filename, 'size': upload.size, 'offset': os.path.getsize(upload_path('partial', f'{upload.id}.part')), 'chunk_size': current_app.config['UPLOAD_CHUNK_BYTES']}
+
+# Upload garbage collection: blobs no attachment references, idle resumable uploads and loose files (crash
+# leftovers, thumbnails of removed blobs, pre-content-addressed uploads whose rows are gone). Anything touched
+# within the grace period is left alone, and both the blob table and the directory are walked a batch at a time.
+def walk_uploads(folder):
+    for entry in os.scandir(folder):
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk_uploads(entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            yield entry
+
+def remove_upload(path):
+    try:
+        os.remove(upload_path(path))
+    except FileNotFoundError:
+        pass
+
+def upload_owner_key(path):
+    # What keeps a file alive: its blob row, its upload session, or an attachment pointing at it
+    top, name = path.split('/', 1)[0], os.path.basename(path)
+    if top == 'partial':
+        return 'upload', name.split('.')[0]
+    if top == 'blobs':
+        return 'blob', os.path.splitext(name)[0]
+    if top == 'thumbs':
+        return 'blob', name.split('-')[0]
+    return 'file', f'uploads/{path}'
+
+def gc_read(stmt):
+    # Lookups run on read_only connections and end at once, so no transaction is held across the walk;
+    # the write lock is only taken by gc_write, for one statement that commits straight away
+    with db.engine.connect().execution_options(read_only=True) as conn:
+        return conn.execute(stmt).all()
+
+def gc_write(stmt):
+    with db.engine.begin() as conn:
+        result = conn.execute(stmt)
+        return result.all() if result.returns_rows else None
+
+def reap_blobs(cutoff, cutoff_ts, batch_size, dry_run):
+    unreferenced = db.and_(Blob.ref_count <= 0, Blob.created_at < cutoff, ~db.exists().where(Attachment.blob_sha256 == Blob.sha256))
+    last = ''
+    while True:
+        rows = gc_read(db.select(Blob.sha256, Blob.path, Blob.size).where(Blob.sha256 > last, unreferenced).order_by(Blob.sha256).limit(batch_size))
+        if not rows:
+            return
+        last = rows[-1].sha256
+        # commit_blob touches a file it deduplicates against, covering the gap before the new attachment commits
+        rows = [row for row in rows if not os.path.exists(upload_path(row.path)) or os.path.getmtime(upload_path(row.path)) < cutoff_ts]
+        if not dry_run and rows:
+            deleted = {sha256 for sha256, in gc_write(db.delete(Blob).where(Blob.sha256.in_([row.sha256 for row in rows]), unreferenced).returning(Blob.sha256))}
+            rows = [row for row in rows if row.sha256 in deleted]
+        for row in rows:
+            if not dry_run:
+                remove_upload(row.path)
+            yield 'blob', row.path, row.size
+
+def reap_files(cutoff_ts, batch_size, dry_run):
+    folder = current_app.config['UPLOAD_FOLDER']
+    batch = []
+    for entry in walk_uploads(folder):
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime < cutoff_ts:
+            batch.append((os.path.relpath(entry.path, folder).replace(os.sep, '/'), stat.st_size))
+        if len(batch) >= batch_size:
+            yield from reap_file_batch(batch, dry_run)
+            batch = []
+    if batch:
+        yield from reap_file_batch(batch, dry_run)
+
+def reap_file_batch(batch, dry_run):
+    keys = {path: upload_owner_key(path) for path, _ in batch}
+    wanted = lambda kind: {key for owner, key in keys.values() if owner == kind}
+    live = {('blob', sha256) for sha256, in gc_read(db.select(Blob.sha256).where(Blob.sha256.in_(wanted('blob'))))}
+    live |= {('file', path) for path, in gc_read(db.select(Attachment.file_path).where(Attachment.file_path.in_(wanted('file'))))}
+    # A partial file idle past the grace period is abandoned whether or not its session row still exists
+    if not dry_run and wanted('upload'):
+        gc_write(db.delete(UploadSession).where(UploadSession.id.in_(wanted('upload'))))
+        for upload_id in wanted('upload'):
+            upload_hashers.pop(upload_id, None)
+    for path, size in batch:
+        if keys[path] in live:
+            continue
+        if not dry_run:
+            remove_upload(path)
+        yield 'upload' if keys[path][0] == 'upload' else 'file', path, size
+
+def collect_garbage(grace, batch_size=500, dry_run=False):
+    # Yields (kind, path, size) for everything removed, or everything that would be with dry_run
+    cutoff, cutoff_ts = datetime.utcnow() - grace, time.time() - grace.total_seconds()
+    yield from reap_blobs(cutoff, cutoff_ts, batch_size, dry_run)
+    yield from reap_files(cutoff_ts, batch_size, dry_run)
+
+@click.command('gc-uploads')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without removing anything.')
+@click.option('--grace-hours', default=24.0, show_default=True, help='Leave anything modified more recently alone.')
+@click.option('--batch-size', default=500, show_default=True, help='Rows and files examined per query.')
+@with_appcontext
+def gc_uploads(dry_run, grace_hours, batch_size):
+    """Remove uploaded files and blobs that no attachment references."""
+    totals = Counter()
+    for kind, path, size in collect_garbage(timedelta(hours=grace_hours), batch_size, dry_run):
+        if dry_run:
+            click.echo(f'{kind}\t{size}\t{path}')
+        totals[kind] += 1
+        totals['bytes'] += size
+    click.echo(json.dumps({'dry_run': dry_run, 'blob': totals['blob'], 'upload': totals['upload'], 'file': totals['file'], 'bytes': totals['bytes']}))
@@ -0,0 +1,89 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from .models import db, Task, Subtask, Attachment, RecurrenceException, UserSequence, Tombstone
+
+# Change tracking for delta sync: each flush stamps changed rows with their owner's next sequence number
+SYNCED_MODELS = {Task: 'task', Subtask: 'subtask', Attachment: 'attachment', RecurrenceException: 'exception'}
+
+def next_seq(session, user_id):
+    stmt = sqlite_insert(UserSequence).values(user_id=user_id, seq=1)
+    return session.execute(stmt.on_conflict_do_update(index_elements=['user_id'], set_={'seq': UserSequence.seq + 1}).returning(UserSequence.seq)).scalar()
+
+def change_owner(session, obj):
+    if isinstance(obj, Task): return obj.user_id
+    task = obj.task or session.get(Task, obj.task_id)
+    return task.user_id if task else None
+
+@event.listens_for(Session, 'before_flush')
+def stamp_changes(session, flush_context, instances):
+    changed = [obj for obj in session.new if type(obj) in SYNCED_MODELS]
+    changed += [obj for obj in session.dirty if type(obj) in SYNCED_MODELS and session.is_modified(obj, include_collections=False)]
+    deleted = [obj for obj in session.deleted if type(obj) in SYNCED_MODELS]
+    if not changed and not deleted: return
+    seqs = {}
+    # (user_id, seq, entity, obj, op) for the change feed, read back once the flush has assigned ids
+    flushed = session.info['flushed_changes'] = []
+    with session.no_autoflush:
+        for obj in changed + deleted:
+            user_id = change_owner(session, obj)
+            if user_id is not None and user_id not in seqs: seqs[user_id] = next_seq(session, user_id)
+        for obj in changed:
+            user_id = change_owner(session, obj)
+            if user_id is None: continue
+            obj.seq = seqs[user_id]
+            flushed.append((user_id, seqs[user_id], SYNCED_MODELS[type(obj)], obj, 'update' if obj in session.dirty else 'create'))
+        for obj in deleted:
+            user_id = change_owner(session, obj)
+            if user_id is None: continue
+            session.add(Tombstone(user_id=user_id, entity=SYNCED_MODELS[type(obj)], entity_id=obj.id, seq=seqs[user_id]))
+            flushed.append((user_id, seqs[user_id], SYNCED_MODELS[type(obj)], obj, 'delete'))
+
+# In-process LRU of serialized task lists. Keys carry the owner's change sequence,
+# so a write makes old entries unreachable and they simply age out.
+class ResponseCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, count_miss=True):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                if count_miss: self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size, 'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+def list_cache_key(user_id, version, args):
+    # Every write bumps the owner's change sequence, so it doubles as the list version
+    cache_key = (user_id, version, tuple(sorted(args.items(multi=True))))
+    return cache_key, f'{version}-' + hashlib.sha1(repr(cache_key).encode()).hexdigest()[:16]
+
+def current_seq(user_id):
+    return db.session.query(UserSequence.seq).filter_by(user_id=user_id).scalar() or 0
@@ -0,0 +1,343 @@
+import re
+import json
+import base64
+from datetime import datetime
+from collections import Counter
+from flask import current_app
+from sqlalchemy import bindparam, case, event, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from .models import db, PRIORITY_RANKS, PRIORITY_ERROR, Task, Subtask, Attachment, Blob, Tombstone, TaskCount, UserSequence, Tag, task_tags, parse_tags
+from .schema import FTS_WEIGHTS
+from .sync import SYNCED_MODELS, next_seq
+from .storage import apply_blob_deltas
+from .serialize import serialize_tasks
+from .reminders import pending_changes
+from .events import publish
+from .recurrence import RECURRENCE_UNITS, MAX_INTERVAL
+
+STREAM_CHUNK = 200
+
+# Board ordering shared by the list query, keyset cursors and streaming
+# (column, descending) pairs; Task.id breaks ties so every row has a unique position for keyset pagination
+TASK_SORT = [(Task.is_pinned, True), (Task.completed, False), (Task.priority_rank, False), (Task.due_date, False), (Task.created_at, True), (Task.id, False)]
+
+def encode_cursor(key):
+    # key holds the TASK_SORT values of the last row on the page
+    key = [v.isoformat() if isinstance(v, datetime) else v for v in key]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    if not isinstance(key, list) or len(key) != len(TASK_SORT): raise ValueError('Malformed cursor')
+    key[0] = None if key[0] is None else int(key[0])
+    key[1] = None if key[1] is None else int(key[1])
+    key[3] = datetime.fromisoformat(key[3]) if key[3] else None
+    key[4] = datetime.fromisoformat(key[4]) if key[4] else None
+    # priority_rank and id are bound as they are, so anything but an integer is refused here
+    if any(key[i] is not None and type(key[i]) is not int for i in (2, 5)): raise ValueError('Malformed cursor')
+    return key
+
+def after_cursor(key):
+    # SQLite sorts NULLs first, so "after NULL" ascending means NOT NULL and descending means nothing
+    def eq(col, value): return col.is_(None) if value is None else col == value
+    def gt(col, desc, value):
+        if desc: return db.false() if value is None else db.or_(col < value, col.is_(None))
+        return col.isnot(None) if value is None else col > value
+    clauses = []
+    for i, (col, desc) in enumerate(TASK_SORT):
+        clauses.append(db.and_(*[eq(c, key[j]) for j, (c, _) in enumerate(TASK_SORT[:i])], gt(col, desc, key[i])))
+    return db.or_(*clauses)
+
+def stream_tasks(stmt, fields, include, counts, ndjson):
+    # Serialized a chunk at a time so children still load with one query per chunk
+    first = True
+    for chunk in db.session.execute(stmt.execution_options(yield_per=STREAM_CHUNK)).partitions():
+        for data in serialize_tasks(chunk, fields, include):
+            if ndjson:
+                yield current_app.json.dumps(data) + '\n'
+                continue
+            yield ('{"tasks": [' if first else ',') + current_app.json.dumps(data)
+            first = False
+    if not ndjson:
+        yield ('{"tasks": [' if first else '') + '], "counts": ' + current_app.json.dumps(counts) + '}'
+
+def fts_match(search_query):
+    # Every word must match, each as a prefix so "gro" finds "groceries"
+    words = re.findall(r'\w+', search_query)
+    return ' '.join('"%s"*' % w for w in words) if words else None
+
+def search_matches(match):
+    rank = db.func.bm25(db.literal_column('task_fts'), *FTS_WEIGHTS).label('rank')
+    return db.select(db.column('rowid').label('task_id'), rank).select_from(db.table('task_fts')).where(db.text('task_fts MATCH :match').bindparams(match=match)).subquery()
+
+def sync_tags(task):
+    names = parse_tags(task.tags)
+    existing = {tag.name: tag for tag in Tag.query.filter(Tag.user_id == task.user_id, Tag.name.in_(names))} if names else {}
+    task.tag_set = [existing.get(name) or Tag(user_id=task.user_id, name=name) for name in names]
+
+def tag_filter(user_id, names, match_all):
+    tagged = db.select(task_tags.c.task_id).join(Tag, Tag.id == task_tags.c.tag_id).where(Tag.user_id == user_id, Tag.name.in_(names))
+    if match_all:
+        tagged = tagged.group_by(task_tags.c.task_id).having(db.func.count() == len(names))
+    return Task.id.in_(tagged)
+
+def count_key(task):
+    return (task.category or '', bool(task.completed))
+
+def bump_count(user_id, key, delta):
+    category, completed = key
+    stmt = sqlite_insert(TaskCount).values(user_id=user_id, category=category, completed=completed, count=delta)
+    db.session.execute(stmt.on_conflict_do_update(index_elements=['user_id', 'category', 'completed'], set_={'count': TaskCount.count + delta}))
+
+def move_count(user_id, old_key, new_key):
+    if old_key != new_key:
+        # Both counters in one statement
+        stmt = sqlite_insert(TaskCount).values([
+            {'user_id': user_id, 'category': old_key[0], 'completed': old_key[1], 'count': -1},
+            {'user_id': user_id, 'category': new_key[0], 'completed': new_key[1], 'count': 1},
+        ])
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['user_id', 'category', 'completed'], set_={'count': TaskCount.count + stmt.excluded.count}))
+
+def get_counts(user_id):
+    rows = db.session.query(TaskCount.category, db.func.sum(TaskCount.count)).filter_by(user_id=user_id).group_by(TaskCount.category).all()
+    counts = {'Personal': 0, 'Work': 0}
+    counts.update({category: int(total) for category, total in rows if total})
+    counts['all'] = sum(counts.values())
+    counts['todo'] = counts.pop('TO-DO', 0)
+    return counts
+
+# Hot interactive flags: the owner check, the flip and the sequence stamp are one conditional
+# UPDATE ... RETURNING, so two devices toggling at once cannot overwrite each other's change
+
+def set_flag(model, id, user_id, field, value=None):
+    # value None flips the flag; returns {'id', field, 'seq'}, or None when the row is not the user's
+    table = model.__table__
+    column = table.c[field]
+    owned = table.c.user_id == user_id if model is Task else table.c.task_id.in_(db.select(Task.id).where(Task.user_id == user_id))
+    stmt = table.update().where(table.c.id == id, owned)
+    stmt = stmt.values({field: ~column}) if value is None else stmt.where(column.is_not(value)).values({field: value})
+    version = db.select(func.coalesce(func.max(UserSequence.seq), 0) + 1).where(UserSequence.user_id == user_id).scalar_subquery()
+    extra = [table.c.category, table.c.due_date, table.c.title, table.c.recurrence] if model is Task else [table.c.task_id]
+    row = db.session.execute(stmt.values(seq=version).returning(table.c.id, column, table.c.seq, *extra)).first()
+    if row is None:
+        # Setting a flag to the value it already has writes nothing; report the current state
+        if value is None: return None
+        row = db.session.execute(db.select(table.c.id, column, table.c.seq).where(table.c.id == id, owned)).first()
+        return dict(row._mapping) if row else None
+    # The write transaction holds the database lock, so nobody else can have taken this sequence number
+    db.session.execute(sqlite_insert(UserSequence).values(user_id=user_id, seq=row.seq).on_conflict_do_update(index_elements=['user_id'], set_={'seq': row.seq}))
+    if model is Task and field == 'completed':
+        move_count(user_id, (row.category or '', not row.completed), (row.category or '', row.completed))
+        # Core statements skip the session hooks that keep the reminder heap current
+        pending_changes(db.session).append((row.id, user_id, row.due_date, row.completed, row.title, row.seq, False, row.recurrence is not None))
+    publish(db.session, {(user_id, row.seq): [{'entity': SYNCED_MODELS[model], 'id': row.id, 'op': 'update', field: row[1]}]})
+    return {'id': row.id, field: row[1], 'seq': row.seq}
+
+# Batch mutations: applied in order inside one transaction, all or nothing
+MAX_BATCH_OPS = 500
+TASK_FIELDS = ('title', 'description', 'category', 'color', 'tags', 'focus_duration')
+RECURRENCE_FIELDS = ('recurrence', 'recurrence_interval', 'recurrence_end')
+
+class BatchError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def parse_due_date(value):
+    if not value: return None
+    try: return datetime.strptime(value, '%Y-%m-%dT%H:%M') if 'T' in value else datetime.strptime(value, '%Y-%m-%d')
+    except ValueError: return None
+
+def field_type_ok(field, value):
+    # Anything else would only fail at flush, past the batch's error handling
+    if field == 'title': return isinstance(value, str) and value != ''
+    if field == 'focus_duration': return value is None or (type(value) is int)
+    return value is None or isinstance(value, str)
+
+def apply_task_fields(task, data):
+    for field in TASK_FIELDS:
+        if field not in data: continue
+        if not field_type_ok(field, data[field]): raise BatchError('Malformed op')
+        setattr(task, field, data[field])
+    if 'priority' in data:
+        if not isinstance(data['priority'], str) or data['priority'] not in PRIORITY_RANKS: raise BatchError(PRIORITY_ERROR)
+        task.priority_rank = PRIORITY_RANKS[data['priority']]
+    if 'due_date' in data: task.due_date = parse_due_date(data['due_date'])
+    if 'tags' in data: sync_tags(task)
+    apply_recurrence(task, data)
+
+def apply_recurrence(task, data):
+    # recurrence: daily, weekly, monthly, custom (every recurrence_interval days) or none;
+    # recurrence_end: last date an occurrence may fall on, inclusive
+    if 'recurrence' in data:
+        value = data['recurrence'] or None
+        if value == 'none': value = None
+        if value is not None and value not in RECURRENCE_UNITS: raise BatchError(f'Unknown recurrence: {value}')
+        task.recurrence = value
+    if 'recurrence_interval' in data:
+        value = data['recurrence_interval']
+        try: interval = int(value) if value not in (None, '') else None
+        except (TypeError, ValueError): raise BatchError('recurrence_interval must be a whole number')
+        if interval is not None and not 1 <= interval <= MAX_INTERVAL: raise BatchError(f'recurrence_interval must be between 1 and {MAX_INTERVAL}')
+        task.recurrence_interval = interval
+    if 'recurrence_end' in data:
+        value = data['recurrence_end']
+        end = parse_due_date(value)
+        if value and end is None: raise BatchError('Invalid recurrence_end')
+        task.recurrence_end = end.replace(hour=23, minute=59, second=59) if end and 'T' not in value else end
+    if task.recurrence is None:
+        task.recurrence_interval = task.recurrence_end = None
+    elif task.due_date is None:
+        raise BatchError('A repeating task needs a due date for its first occurrence')
+
+def apply_subtask_ops(task, ops, subtasks):
+    results = []
+    for op in ops:
+        kind = op.get('op')
+        if kind == 'create':
+            if not op.get('text'): raise BatchError('Subtask text is required')
+            if not isinstance(op['text'], str): raise BatchError('Malformed op')
+            subtask = Subtask(text=op['text'], completed=bool(op.get('completed', False)), task=task)
+            db.session.add(subtask)
+            results.append(({'op': kind}, subtask))
+            continue
+        subtask = subtasks.get(op.get('id'))
+        if subtask is None or subtask.task_id != task.id: raise BatchError('Subtask not found', 404)
+        if kind == 'update':
+            if not isinstance(op.get('text', ''), str): raise BatchError('Malformed op')
+            subtask.text = op.get('text', subtask.text)
+        elif kind == 'complete': subtask.completed = bool(op['value']) if 'value' in op else not subtask.completed
+        elif kind == 'delete': db.session.delete(subtask)
+        else: raise BatchError(f'Unknown subtask op: {kind}')
+        results.append(({'op': kind, 'id': subtask.id, 'completed': subtask.completed} if kind == 'complete' else {'op': kind, 'id': subtask.id}, None))
+    return results
+
+def apply_batch_op(user_id, op, tasks, subtasks, refs):
+    # tasks holds the loaded tasks by id; refs the batch's own creations by their string ref,
+    # so a ref can never stand in for an existing task
+    kind = op.get('op')
+    if kind == 'create':
+        data = op.get('task') or {}
+        if not data.get('title'): raise BatchError('Task title is required')
+        task = Task(title=data['title'], category='Personal', priority_rank=2, completed=False, is_pinned=False, focus_duration=25, color='default', tags='', user_id=user_id)
+        apply_task_fields(task, data)
+        db.session.add(task)
+        bump_count(user_id, count_key(task), 1)
+        ref = op.get('ref')
+        if ref is not None:
+            if not isinstance(ref, str): raise BatchError('ref must be a string')
+            refs[ref] = task
+        return {'op': kind, 'ref': ref}, task, apply_subtask_ops(task, op.get('subtasks') or [], subtasks)
+    found = refs if isinstance(op.get('id'), str) else tasks
+    task = found.get(op.get('id'))
+    if task is None: raise BatchError('Task not found', 404)
+    old_key = count_key(task)
+    if kind == 'update':
+        apply_task_fields(task, op.get('task') or {})
+        move_count(user_id, old_key, count_key(task))
+        return {'op': kind, 'id': task.id}, task, apply_subtask_ops(task, op.get('subtasks') or [], subtasks)
+    if kind == 'complete':
+        task.completed = bool(op['value']) if 'value' in op else not task.completed
+        move_count(user_id, old_key, count_key(task))
+        return {'op': kind, 'id': task.id, 'completed': task.completed}, None, []
+    if kind == 'pin':
+        task.is_pinned = bool(op['value']) if 'value' in op else not task.is_pinned
+        return {'op': kind, 'id': task.id, 'is_pinned': task.is_pinned}, None, []
+    if kind == 'delete':
+        bump_count(user_id, old_key, -1)
+        db.session.delete(task)
+        del found[op['id']]
+        return {'op': kind, 'id': task.id}, None, []
+    raise BatchError(f'Unknown op: {kind}')
+
+def parse_ids(value):
+    # Comma-separated ids from a form field; anything that is not an id is ignored
+    return {int(part) for part in (value or '').split(',') if part.strip().isdigit()}
+
+# Checklist order: new subtasks go after the last one of their task
+@event.listens_for(Session, 'before_flush')
+def assign_positions(session, flush_context, instances):
+    added = [obj for obj in session.new if isinstance(obj, Subtask) and obj.position is None]
+    if not added: return
+    task_ids = {obj.task_id for obj in added if obj.task_id is not None}
+    with session.no_autoflush:
+        last = dict(session.execute(db.select(Subtask.task_id, func.max(Subtask.position)).where(Subtask.task_id.in_(task_ids)).group_by(Subtask.task_id)).all()) if task_ids else {}
+    for obj in added:
+        # Subtasks of a task that is itself new are keyed by the Task object until it has an id
+        key = obj.task_id if obj.task_id is not None else obj.task
+        last[key] = (last.get(key) or 0) + 1
+        obj.position = last[key]
+
+# Set-based checklist edits (PATCH /api/tasks/<id>/subtasks): each kind of change is one statement
+# however many subtasks it touches. Core statements bypass the flush hooks, so the sequence stamp,
+# tombstones, blob refcounts and change event they would have written are written here.
+def patch_ids(patch, key):
+    ids = patch.get(key) or []
+    if not isinstance(ids, list) or not all(type(i) is int for i in ids): raise BatchError(f'{key} must be a list of ids')
+    return set(ids)
+
+def apply_subtask_patch(task, patch):
+    updates, inserts, order = patch.get('update') or [], patch.get('insert') or [], patch.get('order') or []
+    if not isinstance(updates, list) or not all(isinstance(u, dict) and type(u.get('id')) is int for u in updates): raise BatchError('Malformed update')
+    if any('text' in u and not (isinstance(u['text'], str) and u['text']) for u in updates): raise BatchError('Subtask text is required')
+    if any('completed' in u and not isinstance(u['completed'], bool) for u in updates): raise BatchError('completed must be a boolean')
+    if not isinstance(inserts, list) or not all(isinstance(i, dict) and isinstance(i.get('text'), str) and i['text'] for i in inserts): raise BatchError('Subtask text is required')
+    if not isinstance(order, list): raise BatchError('Malformed order')
+    toggled, deleted, dropped = patch_ids(patch, 'toggle'), patch_ids(patch, 'delete'), patch_ids(patch, 'delete_attachments')
+    refs = [i['ref'] for i in inserts if i.get('ref') is not None]
+    if not all(isinstance(ref, str) for ref in refs) or len(set(refs)) != len(refs): raise BatchError('Insert refs must be unique strings')
+    if not all(type(e) is int or e in refs for e in order) or len(set(order)) != len(order): raise BatchError('Malformed order')
+    edited = {u['id'] for u in updates} | toggled | {e for e in order if type(e) is int}
+
+    # The caller checked the task belongs to the user; one query maps its subtasks to their positions
+    positions = dict(db.session.execute(db.select(Subtask.id, Subtask.position).where(Subtask.task_id == task.id)).all())
+    if not (edited | deleted) <= positions.keys(): raise BatchError('Subtask not found', 404)
+    if edited & deleted: raise BatchError('Cannot edit a deleted subtask')
+    attachments = db.session.execute(db.select(Attachment.id, Attachment.blob_sha256, Blob.size).outerjoin(Blob, Blob.sha256 == Attachment.blob_sha256)
+                                     .where(Attachment.task_id == task.id, Attachment.id.in_(dropped))).all() if dropped else []
+    if len(attachments) != len(dropped): raise BatchError('Attachment not found', 404)
+
+    seq = next_seq(db.session, task.user_id)
+    subtask = Subtask.__table__
+    if updates:
+        stmt = subtask.update().where(subtask.c.id == bindparam('b_id')).values(
+            text=func.coalesce(bindparam('b_text', type_=db.String), subtask.c.text),
+            completed=func.coalesce(bindparam('b_completed', type_=db.Boolean), subtask.c.completed), seq=seq)
+        db.session.execute(stmt, [{'b_id': u['id'], 'b_text': u.get('text'), 'b_completed': u.get('completed')} for u in updates])
+    if toggled:
+        db.session.execute(subtask.update().where(subtask.c.id.in_(toggled)).values(completed=~subtask.c.completed, seq=seq))
+    inserted, created = {}, {}
+    if inserts:
+        last = max((p for p in positions.values() if p is not None), default=0)
+        rows = [{'text': i['text'], 'completed': bool(i.get('completed', False)), 'task_id': task.id, 'position': last + n, 'seq': seq} for n, i in enumerate(inserts, start=1)]
+        # One multi-row INSERT; rows come back in no guaranteed order, so they are matched up by their new position
+        created = dict(db.session.execute(subtask.insert().returning(subtask.c.position, subtask.c.id), rows).all())
+        for n, item in enumerate(inserts, start=1):
+            positions[created[last + n]] = last + n
+            if item.get('ref') is not None: inserted[item['ref']] = created[last + n]
+    if order:
+        ids = [inserted[e] if isinstance(e, str) else e for e in order]
+        # The listed subtasks trade positions among themselves; unlisted ones stay where they are
+        slots = sorted(positions[i] or i for i in ids)
+        db.session.execute(subtask.update().where(subtask.c.id.in_(ids)).values(position=case(dict(zip(ids, slots)), value=subtask.c.id), seq=seq))
+    if deleted:
+        db.session.execute(subtask.delete().where(subtask.c.id.in_(deleted)))
+    if attachments:
+        db.session.execute(Attachment.__table__.delete().where(Attachment.__table__.c.id.in_(dropped)))
+        refs, used_bytes, used_files = Counter(), Counter(), Counter()
+        for _, sha256, size in attachments:
+            if sha256 is None: continue
+            refs[sha256] -= 1
+            used_bytes[task.user_id] -= size or 0
+            used_files[task.user_id] -= 1
+        apply_blob_deltas(db.session, refs, used_bytes, used_files)
+    tombstones = [{'user_id': task.user_id, 'entity': 'subtask', 'entity_id': i, 'seq': seq} for i in deleted]
+    tombstones += [{'user_id': task.user_id, 'entity': 'attachment', 'entity_id': a.id, 'seq': seq} for a in attachments]
+    if tombstones:
+        db.session.execute(Tombstone.__table__.insert(), tombstones)
+    changes = [{'entity': 'subtask', 'id': i, 'op': 'update'} for i in sorted(edited)]
+    changes += [{'entity': 'subtask', 'id': i, 'op': 'create'} for i in sorted(created.values())]
+    changes += [{'entity': t['entity'], 'id': t['entity_id'], 'op': 'delete'} for t in tombstones]
+    publish(db.session, {(task.user_id, seq): changes})
+    return {'seq': seq, 'inserted': inserted}
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from swify import create_app
+from swify.models import db, Attachment, Task
+
+USER = {'X-User-ID': 'board-owner'}
+SIZES = (1, 10, 60)
+
+
+def build_board(tmp_path, size):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / f'board{size}.db'}", 'UPLOAD_FOLDER': str(tmp_path / f'uploads{size}')})
+    client = app.test_client()
+    ops = [{'op': 'create', 'task': {'title': f'task {i}', 'category': ('Work', 'Personal')[i % 2], 'tags': 'alpha,beta'},
+            'subtasks': [{'op': 'create', 'text': f'step {j}'} for j in range(3)]} for i in range(size)]
+    response = client.post('/api/tasks/batch', json={'ops': ops}, headers=USER)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    with app.app_context():
+        for task in Task.query.filter_by(user_id=USER['X-User-ID']):
+            db.session.add(Attachment(file_path=f'uploads/{task.id}.txt', file_type='document', task=task))
+        db.session.commit()
+    return client
+
+
+def query_count(client, query_string):
+    response = client.get(f'/api/tasks{query_string}', headers=USER)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return int(response.headers['X-Query-Count'])
+
+
+@pytest.mark.parametrize('query_string', ['', '?include=subtasks', '?fields=title&include=', '?category=Work', '?tag=alpha', '?limit=5'])
+def test_task_list_query_count_does_not_grow_with_the_board(tmp_path, query_string):
+    counts = {size: query_count(build_board(tmp_path, size), query_string) for size in SIZES}
+    assert len(set(counts.values())) == 1, counts